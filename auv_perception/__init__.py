@@ -1,7 +1,8 @@
 from __future__ import absolute_import
 
-from . import annotation
-from . import fls
-from . import sonar
+from .lazyImport import lazyAttributes
 
-__all__ = ["annotation", "fls", "sonar"]
+#Subpackages are imported on first use, see lazyImport
+__all__ = ["annotation", "fls", "sonar", "profiling"]
+
+__getattr__, __dir__ = lazyAttributes(__name__, globals(), {name: "." + name for name in __all__})
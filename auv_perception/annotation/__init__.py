@@ -1,5 +1,20 @@
-from .labelsIO import *
-from .rectangle import *
-from .utils import *
-from .randomPatches import *
-from .evaluation import *
+from ..lazyImport import lazyAttributes
+
+#Names are imported from their submodule on first use, so labelsIO and randomPatches
+#only pull PyQt5 and h5py when they are actually needed.
+submoduleAttributes = {
+    ".labelsIO": ["LabeledImage", "Label", "indentXML", "writeXML", "readXML", "labelType", "labeledImageType",
+                  "HDF5LabelsFile"],
+    ".rectangle": ["Rectangle"],
+    ".boxArray": ["BoxArray"],
+    ".utils": ["labelDistribution"],
+    ".randomPatches": ["VALID_AREA_TOP_LEFT", "VALID_AREA_TOP_RIGHT", "VALID_AREA_BOTTOM_LEFT", "VALID_AREA_BOTTOM_RIGHT",
+                       "Line", "topLine", "bottomLine", "rectangleInsideValidArea", "generateRandomRectangle"],
+    ".evaluation": ["bestMatch", "computeRecall", "asBoxArray", "matchDetections", "IOU_DEFINITIONS",
+                    "DetectionEvaluator"],
+}
+
+attributeModules = {name: module for module, names in submoduleAttributes.items() for name in names}
+__all__ = list(attributeModules.keys())
+
+__getattr__, __dir__ = lazyAttributes(__name__, globals(), attributeModules)
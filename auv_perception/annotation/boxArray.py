@@ -0,0 +1,178 @@
+#!/bin/env python3
+
+from __future__ import division, print_function
+
+import numpy as np
+
+from .rectangle import Rectangle
+
+"""
+An array of N rectangles, stored as a contiguous (N, 4) NumPy array of [left, top, right, bottom] coordinates
+(as the properties of Rectangle), so operations over many boxes are vectorized.
+Pairwise operations between a BoxArray of N boxes and another of M boxes return (N, M) arrays.
+iou has the same definition as Rectangle.iou: the intersection area over the area of the box enclosing both
+(union and enclosingAreas), which is also the IoU of both non-maximum supressions. unionIou is the usual intersection
+over the area covered by either box (coveredAreas), as in PASCAL VOC. It is never lower than iou, so both must not be mixed.
+"""
+class BoxArray:
+    def __init__(self, boxes):
+        boxes = np.asarray(boxes)
+
+        if boxes.size == 0:
+            boxes = boxes.reshape((0, 4))
+
+        if boxes.ndim != 2 or boxes.shape[1] != 4:
+            raise ValueError("Boxes must have shape (N, 4), got {}".format(boxes.shape))
+
+        if np.any(boxes[:, 2] < boxes[:, 0]) or np.any(boxes[:, 3] < boxes[:, 1]):
+            raise ValueError("Width and height cannot be negative")
+
+        self.boxes = np.ascontiguousarray(boxes)
+
+    def __str__(self):
+        return "BoxArray({})".format(self.boxes.tolist())
+
+    def __len__(self):
+        return self.boxes.shape[0]
+
+    """
+    An integer index returns a Rectangle, and any other index (slice, integer array, boolean mask) a BoxArray.
+    """
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            left, top, right, bottom = self.boxes[index].tolist()
+
+            return Rectangle((left, top), right - left, bottom - top)
+
+        return BoxArray(self.boxes[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def left(self):
+        return self.boxes[:, 0]
+
+    @property
+    def top(self):
+        return self.boxes[:, 1]
+
+    @property
+    def right(self):
+        return self.boxes[:, 2]
+
+    @property
+    def bottom(self):
+        return self.boxes[:, 3]
+
+    @property
+    def widths(self):
+        return self.right - self.left
+
+    @property
+    def heights(self):
+        return self.bottom - self.top
+
+    @property
+    def centers(self):
+        return np.stack([self.left + self.widths // 2, self.top + self.heights // 2], axis = 1)
+
+    @property
+    def areas(self):
+        return self.widths * self.heights
+
+    """
+    Pairwise intersection areas, zero for boxes that do not overlap.
+    """
+    def intersectionAreas(self, other):
+        width = np.minimum(self.right[:, np.newaxis], other.right[np.newaxis, :]) - np.maximum(self.left[:, np.newaxis], other.left[np.newaxis, :])
+        height = np.minimum(self.bottom[:, np.newaxis], other.bottom[np.newaxis, :]) - np.maximum(self.top[:, np.newaxis], other.top[np.newaxis, :])
+
+        return np.maximum(width, 0) * np.maximum(height, 0)
+
+    """
+    Pairwise areas of the smallest box enclosing both boxes, the areas of union.
+    """
+    def enclosingAreas(self, other):
+        width = np.maximum(self.right[:, np.newaxis], other.right[np.newaxis, :]) - np.minimum(self.left[:, np.newaxis], other.left[np.newaxis, :])
+        height = np.maximum(self.bottom[:, np.newaxis], other.bottom[np.newaxis, :]) - np.minimum(self.top[:, np.newaxis], other.top[np.newaxis, :])
+
+        return width * height
+
+    """
+    Pairwise areas covered by either box (the area of the set union, not of the box returned by union).
+    """
+    def coveredAreas(self, other):
+        return self.areas[:, np.newaxis] + other.areas[np.newaxis, :] - self.intersectionAreas(other)
+
+    """
+    Pairwise intersection over the area of the enclosing box, as Rectangle.iou. Pairs of empty boxes get zero.
+    """
+    def iou(self, other):
+        intersection = self.intersectionAreas(other)
+        enclosing = self.enclosingAreas(other)
+
+        return np.where(enclosing > 0, intersection / np.where(enclosing > 0, enclosing, 1), 0.0)
+
+    """
+    Pairwise intersection over the area covered by either box, as in PASCAL VOC. Pairs of empty boxes get zero.
+    """
+    def unionIou(self, other):
+        intersection = self.intersectionAreas(other)
+        covered = self.areas[:, np.newaxis] + other.areas[np.newaxis, :] - intersection
+
+        return np.where(covered > 0, intersection / np.where(covered > 0, covered, 1), 0.0)
+
+    """
+    Element (i, j) is True if box i of this array fully contains box j of the other.
+    """
+    def contains(self, other):
+        return ((self.left[:, np.newaxis] <= other.left[np.newaxis, :]) & (self.top[:, np.newaxis] <= other.top[np.newaxis, :]) &
+                (self.right[:, np.newaxis] >= other.right[np.newaxis, :]) & (self.bottom[:, np.newaxis] >= other.bottom[np.newaxis, :]))
+
+    """
+    Element (i, j) is True if box i contains the point j of a (P, 2) array, borders included as in Rectangle.containsPoint.
+    """
+    def containsPoints(self, points):
+        points = np.asarray(points).reshape((-1, 2))
+        x = points[np.newaxis, :, 0]
+        y = points[np.newaxis, :, 1]
+
+        return ((self.left[:, np.newaxis] <= x) & (x <= self.right[:, np.newaxis]) &
+                (self.top[:, np.newaxis] <= y) & (y <= self.bottom[:, np.newaxis]))
+
+    """
+    Pairwise intersection of boxes at the same position in two arrays of N boxes, as a BoxArray.
+    Boxes that do not overlap give an empty box at the corner of their intersection.
+    """
+    def intersection(self, other):
+        left = np.maximum(self.left, other.left)
+        top = np.maximum(self.top, other.top)
+        right = np.maximum(np.minimum(self.right, other.right), left)
+        bottom = np.maximum(np.minimum(self.bottom, other.bottom), top)
+
+        return BoxArray(np.stack([left, top, right, bottom], axis = 1))
+
+    """
+    Smallest box enclosing the boxes at the same position in two arrays of N boxes, as Rectangle.union does, as a BoxArray.
+    """
+    def union(self, other):
+        return BoxArray(np.stack([np.minimum(self.left, other.left), np.minimum(self.top, other.top),
+                                  np.maximum(self.right, other.right), np.maximum(self.bottom, other.bottom)], axis = 1))
+
+    def toRectangles(self):
+        return list(self)
+
+    @staticmethod
+    def fromRectangles(rectangles):
+        return BoxArray(np.array([[r.left, r.top, r.right, r.bottom] for r in rectangles], dtype = np.int64).reshape((-1, 4)))
+
+    """
+    Boxes of the given size at a (N, 2) array of top left positions, as returned by polarSlidingWindowPositions.
+    """
+    @staticmethod
+    def fromPositions(positions, size):
+        positions = np.asarray(positions).reshape((-1, 2))
+
+        return BoxArray(np.concatenate([positions, positions + np.asarray(size)], axis = 1))
@@ -2,8 +2,12 @@ from __future__ import division, print_function
 
 import numpy as np
 
+from .boxArray import BoxArray
+from .rectangle import Rectangle
+
 """
 Computes the best matching rectangle for a ground truth rectangle
+Returns the rectangle of groundTruth with the highest IoU with proposal, and that IoU.
 """
 def bestMatch(proposal, groundTruth):
     bestIoU = -1.0
@@ -14,7 +18,7 @@ def bestMatch(proposal, groundTruth):
 
         if candidateIoU > bestIoU:
             bestIoU = candidateIoU
-            bestMatch = proposal
+            bestMatch = gtRect
 
     return bestMatch, bestIoU
 
@@ -41,3 +45,263 @@ def computeRecall(proposals, groundTruth, iouThreshold = 0.5):
         matchIoU.append(iou)
 
     return np.mean(bestMatches), matchIoU
+
+def asBoxArray(boxes):
+    if isinstance(boxes, BoxArray):
+        return boxes
+
+    if len(boxes) > 0 and isinstance(boxes[0], Rectangle):
+        return BoxArray.fromRectangles(boxes)
+
+    return BoxArray(boxes)
+
+"""
+Matches detections to ground truth boxes in one frame at an IoU threshold, given their (N, M) IoU matrix.
+Greedy matching visits detections by decreasing score, and each takes the unmatched ground truth box with which
+it has the highest IoU. Hungarian matching finds the assignment with the largest total IoU, ignoring scores.
+Only pairs with an IoU of at least iouThreshold are matched. Returns a (N,) boolean array, True for matched detections.
+"""
+def matchDetections(iou, scores, iouThreshold, matching = "greedy"):
+    matched = np.zeros(iou.shape[0], dtype = bool)
+
+    if iou.shape[0] == 0 or iou.shape[1] == 0:
+        return matched
+
+    if matching == "hungarian":
+        from scipy.optimize import linear_sum_assignment
+
+        weights = np.where(iou >= iouThreshold, iou, 0.0)
+        rows, cols = linear_sum_assignment(-weights)
+        matched[rows[weights[rows, cols] > 0]] = True
+
+        return matched
+
+    available = np.ones(iou.shape[1], dtype = bool)
+
+    for i in np.argsort(-scores, kind = "stable"):
+        candidates = np.where(available, iou[i], -1.0)
+        best = np.argmax(candidates)
+
+        if candidates[best] >= iouThreshold:
+            matched[i] = True
+            available[best] = False
+
+    return matched
+
+#IoU used by each result of DetectionEvaluator.summary, see DetectionEvaluator
+IOU_DEFINITIONS = {"recall": "union", "precision": "union", "averagePrecision": "union",
+                   "proposalRecall": "enclosing", "meanBestIoU": "enclosing"}
+
+"""
+Accumulates detection results over a dataset, one frame at a time, in memory independent of the number of frames.
+For each IoU threshold, matched (true positive) and unmatched (false positive) detections are counted in
+histograms over their scores, from which recall, precision, precision-recall curves and average precision are computed.
+Matching uses the usual IoU, the intersection over the area covered by either box (BoxArray.unionIou),
+and a detection matches at an IoU of at least the threshold.
+It also keeps the best IoU of each ground truth box with any detection, so proposal recall (regardless of scores and
+one-to-one matching) and mean best IoU are available too. These are computed as computeRecall does, to stay comparable
+with earlier studies: with Rectangle.iou (intersection over the enclosing box, BoxArray.iou), and an IoU strictly above
+the threshold. Ground truth in frames without detections gets a best IoU of 0 (computeRecall gives -1).
+Evaluators with the same configuration, for example filled by parallel workers, are combined with merge.
+"""
+class DetectionEvaluator:
+    def __init__(self, iouThresholds = [0.5], matching = "greedy", scoreBins = 1000, scoreRange = (0.0, 1.0)):
+        if matching not in ["greedy", "hungarian"]:
+            raise ValueError("Invalid matching: {}".format(matching))
+
+        self.iouThresholds = [float(t) for t in iouThresholds]
+        self.matching = matching
+        self.scoreBins = scoreBins
+        self.scoreRange = (float(scoreRange[0]), float(scoreRange[1]))
+
+        thresholdCount = len(self.iouThresholds)
+
+        self.truePositives = np.zeros((thresholdCount, scoreBins), dtype = np.int64)
+        self.falsePositives = np.zeros((thresholdCount, scoreBins), dtype = np.int64)
+        self.coveredGroundTruth = np.zeros(thresholdCount, dtype = np.int64)
+        self.groundTruthCount = 0
+        self.detectionCount = 0
+        self.frameCount = 0
+        self.bestIoUSum = 0.0
+
+    def scoreBinIndices(self, scores):
+        low, high = self.scoreRange
+        bins = np.floor((np.asarray(scores, dtype = np.float64) - low) / (high - low) * self.scoreBins).astype(np.int64)
+
+        return np.clip(bins, 0, self.scoreBins - 1)
+
+    """
+    Adds the detections of one frame. Detections and groundTruth are BoxArrays, lists of Rectangles or (N, 4) arrays,
+    and scores has one score per detection (use ones for unscored proposals).
+    """
+    def addFrame(self, detections, scores, groundTruth):
+        detections = asBoxArray(detections)
+        groundTruth = asBoxArray(groundTruth)
+        scores = np.asarray(scores, dtype = np.float64).reshape(-1)
+
+        if len(scores) != len(detections):
+            raise ValueError("Got {} scores for {} detections".format(len(scores), len(detections)))
+
+        iou = detections.unionIou(groundTruth)
+        bins = self.scoreBinIndices(scores)
+
+        if len(groundTruth) > 0:
+            bestIoU = np.max(detections.iou(groundTruth), axis = 0) if len(detections) > 0 else np.zeros(len(groundTruth))
+            self.bestIoUSum += float(np.sum(bestIoU))
+
+        for t, iouThreshold in enumerate(self.iouThresholds):
+            matched = matchDetections(iou, scores, iouThreshold, self.matching)
+
+            self.truePositives[t] += np.bincount(bins[matched], minlength = self.scoreBins)
+            self.falsePositives[t] += np.bincount(bins[~matched], minlength = self.scoreBins)
+
+            if len(groundTruth) > 0 and len(detections) > 0:
+                self.coveredGroundTruth[t] += int(np.sum(bestIoU > iouThreshold))
+
+        self.groundTruthCount += len(groundTruth)
+        self.detectionCount += len(detections)
+        self.frameCount += 1
+
+    """
+    Adds the counts of another evaluator with the same configuration to this one.
+    """
+    def merge(self, other):
+        if (other.iouThresholds != self.iouThresholds or other.matching != self.matching or
+            other.scoreBins != self.scoreBins or other.scoreRange != self.scoreRange):
+            raise ValueError("Cannot merge evaluators with different configurations")
+
+        self.truePositives += other.truePositives
+        self.falsePositives += other.falsePositives
+        self.coveredGroundTruth += other.coveredGroundTruth
+        self.groundTruthCount += other.groundTruthCount
+        self.detectionCount += other.detectionCount
+        self.frameCount += other.frameCount
+        self.bestIoUSum += other.bestIoUSum
+
+        return self
+
+    def thresholdIndex(self, iouThreshold):
+        if iouThreshold is None:
+            return 0
+
+        if float(iouThreshold) not in self.iouThresholds:
+            raise ValueError("IoU threshold {} was not evaluated, available: {}".format(iouThreshold, self.iouThresholds))
+
+        return self.iouThresholds.index(float(iouThreshold))
+
+    """
+    Fraction of ground truth boxes matched by a detection, at the given IoU threshold (the first one by default).
+    As computeRecall, it is 1.0 if there is no ground truth.
+    """
+    def recall(self, iouThreshold = None):
+        if self.groundTruthCount == 0:
+            return 1.0
+
+        return float(np.sum(self.truePositives[self.thresholdIndex(iouThreshold)])) / self.groundTruthCount
+
+    """
+    Fraction of detections that match a ground truth box, at the given IoU threshold. It is 1.0 if there are no detections.
+    """
+    def precision(self, iouThreshold = None):
+        if self.detectionCount == 0:
+            return 1.0
+
+        return float(np.sum(self.truePositives[self.thresholdIndex(iouThreshold)])) / self.detectionCount
+
+    """
+    Fraction of ground truth boxes whose best Rectangle.iou with any detection is above the IoU threshold,
+    without one-to-one matching, as computeRecall. It is 1.0 if there is no ground truth.
+    """
+    def proposalRecall(self, iouThreshold = None):
+        if self.groundTruthCount == 0:
+            return 1.0
+
+        return float(self.coveredGroundTruth[self.thresholdIndex(iouThreshold)]) / self.groundTruthCount
+
+    """
+    Mean over ground truth boxes of their best Rectangle.iou with any detection, as the IoUs returned by computeRecall.
+    """
+    def meanBestIoU(self):
+        return self.bestIoUSum / self.groundTruthCount if self.groundTruthCount > 0 else 0.0
+
+    """
+    Precision-recall curve at the given IoU threshold, keeping detections with scores above decreasing score thresholds.
+    Returns (scoreThresholds, precision, recall) arrays, with one point per score bin from the highest to the lowest.
+    """
+    def precisionRecallCurve(self, iouThreshold = None):
+        t = self.thresholdIndex(iouThreshold)
+
+        truePositives = np.cumsum(self.truePositives[t][::-1])
+        falsePositives = np.cumsum(self.falsePositives[t][::-1])
+        detections = truePositives + falsePositives
+
+        low, high = self.scoreRange
+        scoreThresholds = low + (high - low) * np.arange(self.scoreBins - 1, -1, -1) / self.scoreBins
+
+        precision = np.where(detections > 0, truePositives / np.maximum(detections, 1), 1.0)
+        recall = truePositives / self.groundTruthCount if self.groundTruthCount > 0 else np.ones(self.scoreBins)
+
+        return scoreThresholds, precision, recall
+
+    """
+    Area under the precision-recall curve at the given IoU threshold, with precision made monotonically decreasing
+    (all point interpolation, as in PASCAL VOC). Scores are resolved to the score bins.
+    """
+    def averagePrecision(self, iouThreshold = None):
+        if self.groundTruthCount == 0:
+            return 1.0
+
+        t = self.thresholdIndex(iouThreshold)
+        scoreThresholds, precision, recall = self.precisionRecallCurve(iouThreshold)
+
+        #Only bins with detections add points to the curve
+        points = (self.truePositives[t] + self.falsePositives[t])[::-1] > 0
+
+        recall = np.concatenate([[0.0], recall[points]])
+        precision = np.concatenate([[1.0], precision[points]])
+        precision = np.maximum.accumulate(precision[::-1])[::-1]
+
+        return float(np.sum((recall[1:] - recall[:-1]) * precision[1:]))
+
+    def meanAveragePrecision(self):
+        return float(np.mean([self.averagePrecision(t) for t in self.iouThresholds]))
+
+    """
+    Summary of the results at every IoU threshold, as a dictionary that can be saved as JSON.
+    Its "iouDefinitions" entry names the IoU behind each field: "union" (BoxArray.unionIou, matched when at least
+    the threshold) or "enclosing" (Rectangle.iou, covered when above the threshold, as computeRecall).
+    """
+    def summary(self):
+        results = {"frames": self.frameCount, "groundTruth": self.groundTruthCount, "detections": self.detectionCount,
+                   "detectionsPerFrame": self.detectionCount / self.frameCount if self.frameCount > 0 else 0.0,
+                   "meanBestIoU": self.meanBestIoU(), "thresholds": {}, "iouDefinitions": dict(IOU_DEFINITIONS)}
+
+        for t in self.iouThresholds:
+            results["thresholds"][str(t)] = {"recall": self.recall(t), "precision": self.precision(t),
+                                             "proposalRecall": self.proposalRecall(t), "averagePrecision": self.averagePrecision(t)}
+
+        return results
+
+    """
+    Full state of the evaluator as a dictionary that can be saved as JSON, to resume or merge later with fromDict.
+    """
+    def toDict(self):
+        return {"iouThresholds": self.iouThresholds, "matching": self.matching, "scoreBins": self.scoreBins,
+                "scoreRange": list(self.scoreRange), "truePositives": self.truePositives.tolist(),
+                "falsePositives": self.falsePositives.tolist(), "coveredGroundTruth": self.coveredGroundTruth.tolist(),
+                "groundTruthCount": self.groundTruthCount, "detectionCount": self.detectionCount,
+                "frameCount": self.frameCount, "bestIoUSum": self.bestIoUSum}
+
+    @staticmethod
+    def fromDict(state):
+        evaluator = DetectionEvaluator(state["iouThresholds"], state["matching"], state["scoreBins"], state["scoreRange"])
+
+        evaluator.truePositives = np.array(state["truePositives"], dtype = np.int64)
+        evaluator.falsePositives = np.array(state["falsePositives"], dtype = np.int64)
+        evaluator.coveredGroundTruth = np.array(state["coveredGroundTruth"], dtype = np.int64)
+        evaluator.groundTruthCount = state["groundTruthCount"]
+        evaluator.detectionCount = state["detectionCount"]
+        evaluator.frameCount = state["frameCount"]
+        evaluator.bestIoUSum = state["bestIoUSum"]
+
+        return evaluator
@@ -5,8 +5,11 @@ from __future__ import division, print_function
 """
 An object representing a rectangle in cartesian coordinates.
 A rectangle is defined by a top left point and a given width and height.
+Coordinates are stored as four ints in slots, without a per object dictionary, as datasets have millions of rectangles.
 """
 class Rectangle:
+    __slots__ = ("x", "y", "w", "h")
+
     def __init__(self, topLeft, width, height):
 
         if width < 0:
@@ -15,8 +18,10 @@ class Rectangle:
         if height < 0:
             raise ValueError("Height cannot be negative")
 
-        self.topLeft = topLeft
-        self.size = (int(width), int(height))
+        self.x = int(topLeft[0])
+        self.y = int(topLeft[1])
+        self.w = int(width)
+        self.h = int(height)
 
     def __str__(self):
         return "Rectangle({}, {}, {})".format(self.topLeft, self.width, self.height)
@@ -25,21 +30,39 @@ class Rectangle:
     def isValid(self):
         return self.width != 0 and self.height != 0
 
+    @property
+    def topLeft(self):
+        return (self.x, self.y)
+
+    @topLeft.setter
+    def topLeft(self, p):
+        self.x = int(p[0])
+        self.y = int(p[1])
+
+    @property
+    def size(self):
+        return (self.w, self.h)
+
+    @size.setter
+    def size(self, s):
+        self.w = int(s[0])
+        self.h = int(s[1])
+
     @property
     def width(self):
-        return self.size[0]
+        return self.w
 
     @width.setter
     def width(self, w):
-        self.size = (w, self.height)
+        self.w = int(w)
 
     @property
     def height(self):
-        return self.size[1]
+        return self.h
 
     @height.setter
     def height(self, h):
-        self.size = (self.width, h)
+        self.h = int(h)
 
     @property
     def center(self):
@@ -63,23 +86,23 @@ class Rectangle:
     
     @property
     def left(self):
-        return self.topLeft[0]
+        return self.x
     
     @property
     def right(self):
-        return self.left + self.width
+        return self.x + self.w
     
     @property
     def top(self):
-        return self.topLeft[1]
+        return self.y
     
     @property
     def bottom(self):
-        return self.top + self.height
+        return self.y + self.h
 
     @property
     def area(self):
-        return self.width * self.height
+        return self.w * self.h
     
     def union(self, otherRectangle):
         l = min(self.left, otherRectangle.left)
@@ -102,8 +125,21 @@ class Rectangle:
         
         return Rectangle.fromPoint(topLeft = (l, t), bottomRight = (r, b))
     
+    def intersectionArea(self, otherRectangle):
+        width = min(self.x + self.w, otherRectangle.x + otherRectangle.w) - max(self.x, otherRectangle.x)
+        height = min(self.y + self.h, otherRectangle.y + otherRectangle.h) - max(self.y, otherRectangle.y)
+
+        if width < 0 or height < 0:
+            return 0
+
+        return width * height
+
+    #Area of the intersection over the area of the smallest rectangle enclosing both (as given by union), without building either
     def iou(self, otherRectangle):
-        return float(self.intersection(otherRectangle).area) / float(self.union(otherRectangle).area)
+        width = max(self.x + self.w, otherRectangle.x + otherRectangle.w) - min(self.x, otherRectangle.x)
+        height = max(self.y + self.h, otherRectangle.y + otherRectangle.h) - min(self.y, otherRectangle.y)
+
+        return float(self.intersectionArea(otherRectangle)) / float(width * height)
     
     def containsPoint(self, point):
         if point[0] < self.left or point[0] > self.right:
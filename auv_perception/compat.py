@@ -1,7 +1,8 @@
-from PIL import Image
 import numpy as np
 
 def imresize(image, output_shape, interp="box"):
+    from PIL import Image
+
     mode = Image.BOX
 
     if interp is "bilinear":
@@ -1,5 +1,42 @@
-from .ARISFile import *
-from .cnnProposalClassifier import *
-from .fcnProposalClassifier import *
-from .visualization import *
-from .objectProposals import *
+from ..lazyImport import lazyAttributes
+
+#Names are imported from their submodule on first use, so reading ARIS files or generating proposals
+#does not pull Keras (FCN and Keras CNN evaluators) or PyQt5 (visualization).
+submoduleAttributes = {
+    ".ARISFile": ["MasterHeader", "FrameHeader", "beamsForPingMode", "ARISFrame", "ARISFrameFile"],
+    ".cnnProposalClassifier": ["CNNProposalBinaryEvaluator", "CNNProposalScoreEvaluator", "TMProposalEvaluator"],
+    ".fcnProposalClassifier": ["FCNProposalScorer"],
+    ".visualization": ["paintColorProposalScoreHeatmap", "paintGrayscaleProposalScoreHeatmap", "paintProposalBoxes"],
+    ".objectProposals": ["ProposalEvaluator", "RandomProposalEvaluator", "bestMatch", "nonMaximumSupression",
+                         "nonMaximumSupressionArray", "proposalWindowSizes", "TopProposals", "scoreWindows",
+                         "iterProposals", "generateProposals", "generateProposalsMultiThreshold",
+                         "denseProposalScores", "denseProposalScoreMap", "slidingWindowScores",
+                         "iterSlidingWindowDetections", "generateSlidingWindowDetections",
+                         "generateSlidingWindowDetectionsMultiThreshold",
+                         "generateObjectnessMapDetections", "generateObjectnessMapDetectionsMultiThreshold",
+                         "generateObjectnessMapDetectionsArray"],
+    ".incrementalProposals": ["IncrementalProposalGenerator"],
+    ".proposalCascade": ["IntegralImages", "WindowStatisticStage", "ProposalCascade"],
+    ".fullyConvolutional": ["buildFullyConvolutionalModel", "fullyConvolutionalSupported", "fullyConvolutionalStride",
+                            "denseWindowScores"],
+    ".numpyInference": ["relu", "sigmoid", "softmax", "ACTIVATIONS", "activationFunction", "im2col",
+                        "NumpyConvolution2D", "NumpyMaxPooling2D", "NumpyBatchNormalization", "NumpyFlatten",
+                        "NumpyDense", "readKerasWeights", "parseKerasVersion", "convertLegacyKernel",
+                        "NumpySequentialModel"],
+    ".sharedModels": ["SharedModel", "ModelRegistry", "modelRegistry"],
+    ".templateMatching": ["maxNormalizedCrossCorrelationMap", "MAX_SCORE_MATRIX_BYTES", "templateChunkSize",
+                          "normalizedTemplateMatrix", "maxNormalizedCrossCorrelationBatch",
+                          "squareDifferenceTemplateMatrix", "minNormalizedSquareDifferenceBatch", "normalizedWindowMatrix",
+                          "kMeans", "TemplateIndex", "compareTemplateIndex"],
+    ".inferenceServer": ["evaluateWindows", "InferenceServer", "RemoteProposalEvaluator"],
+    ".framePipeline": ["PipelineStage", "FramePipeline", "arisProposalPipeline"],
+    ".tiledInference": ["networkGeometry", "outputLength", "activationBytes", "tileSizeForBudget", "batchSizeForBudget",
+                        "tiledPredict"],
+    ".objectnessMap": ["responseCoordinates", "interpolationWeights", "ObjectnessMap"],
+    ".recallBenchmark": ["xmlDatasetFrames", "hdf5DatasetFrames", "runRecallBenchmark", "readResults", "recallReport"],
+}
+
+attributeModules = {name: module for module, names in submoduleAttributes.items() for name in names}
+__all__ = list(attributeModules.keys())
+
+__getattr__, __dir__ = lazyAttributes(__name__, globals(), attributeModules)
@@ -1,28 +1,95 @@
 #!/usr/bin/env python3
 
 import numpy as np
-import keras
-
-from keras.models import Sequential
-from keras.layers import Dense, Dropout, Activation, Flatten, BatchNormalization
-from keras.layers import Convolution2D, MaxPooling2D
 
 from math import sqrt
 
-from .objectProposals import ProposalEvaluator
+from .objectProposals import ProposalEvaluator, slidingWindowScores
+from .numpyInference import NumpySequentialModel, NumpyConvolution2D, NumpyMaxPooling2D
+from .numpyInference import NumpyBatchNormalization, NumpyFlatten, NumpyDense
+from .sharedModels import modelRegistry
+
+from .. import profiling
 
 from ..compat import imresize
 
+"""
+Scores of all 96x96 windows of an image for a CNN proposal evaluator, see its denseScores.
+The fully convolutional version of the model is used when the model can be converted and the stride is a multiple
+of the network stride, else the windows are stacked and scored in batches with scoreBatch.
+"""
+def cnnDenseScores(evaluator, image, stride):
+    #The bundled models normalize the column axis (BatchNormalization axis -1 on channels first feature maps),
+    #so fullyConvolutionalSupported is False for them and this single forward pass is never taken with their weights.
+    #It is used by models with channel axis normalization only
+    if evaluator.backend == "keras":
+        from .fullyConvolutional import fullyConvolutionalSupported, fullyConvolutionalStride, denseWindowScores
+
+        networkStride = fullyConvolutionalStride(evaluator.model)
+
+        if stride % networkStride == 0 and fullyConvolutionalSupported(evaluator.model):
+            return denseWindowScores(evaluator.fullyConvolutionalModel(), networkStride, image, stride)
+
+    return slidingWindowScores(evaluator.scoreBatch, image, (96, 96), stride)
+
+"""
+Binary object/background CNN classifier for 96x96 windows.
+The model runs on Keras by default, or on the pure NumPy inference engine with backend = "numpy",
+which does not need Keras installed. Models are cached in the process-wide modelRegistry,
+so constructing more evaluators with the same weights does not load them again.
+"""
 class CNNProposalBinaryEvaluator(ProposalEvaluator):
-    def __init__(self, weightsFile = None):
-        self.model = self.buildKerasModel()
-
+    def __init__(self, weightsFile = None, backend = "keras"):
         if weightsFile is None:
-            self.model.load_weights("cnnProposalFixedBinaryWeights.hdf5")
-        else:
-            self.model.load_weights(weightsFile)
+            weightsFile = "cnnProposalFixedBinaryWeights.hdf5"
+
+        if backend not in ["keras", "numpy"]:
+            raise ValueError("Invalid backend: {}".format(backend))
+
+        def loadModel():
+            if backend == "keras":
+                model = self.buildKerasModel()
+                model.load_weights(weightsFile)
+            else:
+                model = self.buildNumpyModel()
+                model.loadWeights(weightsFile)
+
+            return model
+
+        #Models are loaded once per process and shared between evaluators
+        self.model = modelRegistry.load("CNNProposalBinaryEvaluator/{}".format(backend), weightsFile, loadModel,
+                                        warmupShape = (1, 1, 96, 96))
+
+        self.backend = backend
+        self.weightsFile = weightsFile
+        self.fcnModel = None
+
+    def fullyConvolutionalModel(self):
+        from .fullyConvolutional import buildFullyConvolutionalModel
+
+        if self.backend != "keras":
+            raise ValueError("Fully convolutional scoring requires the keras backend")
+
+        if self.fcnModel is None:
+            self.fcnModel = modelRegistry.load("CNNProposalBinaryEvaluator/fullyConvolutional", self.weightsFile,
+                                               lambda: buildFullyConvolutionalModel(self.model), warmupShape = (1, 1, 96, 96))
+
+        return self.fcnModel
+
+    """
+    Scores all 96x96 windows of the image, returning a 2D array whose element (i, j) is the probability of class 1
+    (as compared by evaluate) for the window with top left corner (i * stride, j * stride).
+    The shipped model normalizes the column axis in its inner BatchNormalization layers, so it has no fully convolutional
+    equivalent, and the windows are scored in batches (see cnnDenseScores). Both ways give the scores of each window up to rounding.
+    """
+    def denseScores(self, image, stride = 8):
+        return cnnDenseScores(self, image, stride)
 
     def buildKerasModel(self):
+        from keras.models import Sequential
+        from keras.layers import Dense, Flatten, BatchNormalization
+        from keras.layers import Convolution2D, MaxPooling2D
+
         model = Sequential()
 
         model.add(Convolution2D(12, 5, 5, border_mode='valid', input_shape=(1, 96, 96), activation = "relu"))
@@ -43,6 +110,24 @@ class CNNProposalBinaryEvaluator(ProposalEvaluator):
 
         return model
 
+    def buildNumpyModel(self):
+        return NumpySequentialModel([
+            NumpyConvolution2D(12, (5, 5), activation = "relu"),
+            NumpyMaxPooling2D((2, 2)),
+            NumpyBatchNormalization(),
+
+            NumpyConvolution2D(12, (5, 5), activation = "relu"),
+            NumpyMaxPooling2D((2, 2)),
+            NumpyBatchNormalization(),
+
+            NumpyFlatten(),
+            NumpyDense(64, activation = "relu"),
+            NumpyBatchNormalization(),
+
+            NumpyDense(2, activation = "softmax")
+        ])
+
+    @profiling.profiled("CNNProposalBinaryEvaluator.evaluate")
     def evaluate(self, windowImage):
         probs = self.model.predict(windowImage.reshape(1, 1, 96, 96), batch_size = 1)[0]
 
@@ -55,6 +140,22 @@ class CNNProposalBinaryEvaluator(ProposalEvaluator):
         else:
             return False, probs[0]
 
+    """
+    Evaluates a batch of windows with shape (N, 96, 96) in a single forward pass.
+    Returns a boolean array of decisions and an array of scores, as evaluate would for each window.
+    """
+    def evaluateBatch(self, windowImages, batchSize = 256):
+        probs = self.model.predict(windowImages.reshape(-1, 1, 96, 96), batch_size = batchSize)
+        decisions = probs[:, 1] >= probs[:, 0]
+
+        return decisions, np.where(decisions, probs[:, 1], probs[:, 0])
+
+    """
+    Probability of class 1 (the one evaluate compares against class 0) for a batch of windows with shape (N, 96, 96).
+    """
+    def scoreBatch(self, windowImages, batchSize = 256):
+        return self.model.predict(windowImages.reshape(-1, 1, 96, 96), batch_size = batchSize)[:, 1]
+
     def resizeAndClassify(self, image):
         resizedImage = None
 
@@ -65,18 +166,66 @@ class CNNProposalBinaryEvaluator(ProposalEvaluator):
 
         return self.classify(resizedImage)
 
+"""
+CNN objectness score regressor for 96x96 windows.
+The model runs on Keras by default, or on the pure NumPy inference engine with backend = "numpy",
+which does not need Keras installed. Models are cached in the process-wide modelRegistry,
+so constructing more evaluators with the same weights does not load them again.
+"""
 class CNNProposalScoreEvaluator(ProposalEvaluator):
-    def __init__(self, weightsFile = None):
-        self.model = self.buildKerasModel()
-
+    def __init__(self, weightsFile = None, backend = "keras"):
         if weightsFile is None:
-            self.model.load_weights("cnnProposalFixedScoreWeights.hdf5")
-        else:
-            self.model.load_weights(weightsFile)
+            weightsFile = "cnnProposalFixedScoreWeights.hdf5"
+
+        if backend not in ["keras", "numpy"]:
+            raise ValueError("Invalid backend: {}".format(backend))
+
+        def loadModel():
+            if backend == "keras":
+                model = self.buildKerasModel()
+                model.load_weights(weightsFile)
+            else:
+                model = self.buildNumpyModel()
+                model.loadWeights(weightsFile)
+
+            return model
+
+        #Models are loaded once per process and shared between evaluators
+        self.model = modelRegistry.load("CNNProposalScoreEvaluator/{}".format(backend), weightsFile, loadModel,
+                                        warmupShape = (1, 1, 96, 96))
+
+        self.backend = backend
+        self.weightsFile = weightsFile
+        self.fcnModel = None
 
         self.threshold = 0.5
 
+    def fullyConvolutionalModel(self):
+        from .fullyConvolutional import buildFullyConvolutionalModel
+
+        if self.backend != "keras":
+            raise ValueError("Fully convolutional scoring requires the keras backend")
+
+        if self.fcnModel is None:
+            self.fcnModel = modelRegistry.load("CNNProposalScoreEvaluator/fullyConvolutional", self.weightsFile,
+                                               lambda: buildFullyConvolutionalModel(self.model), warmupShape = (1, 1, 96, 96))
+
+        return self.fcnModel
+
+    """
+    Scores all 96x96 windows of the image, returning a 2D array whose element (i, j) is the score() of the window
+    with top left corner (i * stride, j * stride).
+    The shipped model normalizes the column axis in its inner BatchNormalization layers, so it has no fully convolutional
+    equivalent, and the windows are scored in batches (see cnnDenseScores). Both ways give the scores of each window up to rounding.
+    """
+    def denseScores(self, image, stride = 8):
+        return cnnDenseScores(self, image, stride)
+
     def buildKerasModel(self):
+        from keras.models import Sequential
+        from keras.layers import Dense, Flatten, BatchNormalization
+        from keras.layers import Convolution2D, MaxPooling2D
+
         model = Sequential()
 
         model.add(Convolution2D(32, 5, 5, border_mode='valid', input_shape=(1, 96, 96), activation = "relu"))
@@ -102,9 +251,33 @@ class CNNProposalScoreEvaluator(ProposalEvaluator):
 
         return (score > self.threshold), score
 
+    def buildNumpyModel(self):
+        return NumpySequentialModel([
+            NumpyConvolution2D(32, (5, 5), activation = "relu"),
+            NumpyMaxPooling2D((2, 2)),
+            NumpyBatchNormalization(),
+
+            NumpyConvolution2D(32, (5, 5), activation = "relu"),
+            NumpyMaxPooling2D((2, 2)),
+            NumpyBatchNormalization(),
+
+            NumpyFlatten(),
+            NumpyDense(96, activation = "relu"),
+            NumpyBatchNormalization(),
+
+            NumpyDense(1, activation = "sigmoid")
+        ])
+
+    @profiling.profiled("CNNProposalScoreEvaluator.score")
     def score(self, windowImage):
         return self.model.predict(windowImage.reshape(1, 1, 96, 96), batch_size = 1)[0]
 
+    """
+    Scores a batch of windows with shape (N, 96, 96) in a single forward pass, returning an array of N scores.
+    """
+    def scoreBatch(self, windowImages, batchSize = 256):
+        return self.model.predict(windowImages.reshape(-1, 1, 96, 96), batch_size = batchSize)[:, 0]
+
     def resizeAndScore(self, image):
         resizedImage = None
 
@@ -132,6 +305,11 @@ class TMProposalEvaluator(ProposalEvaluator):
         else:
             raise ValueError("Invalid mode: {}".format(mode))
 
+        self.mode = mode
+        self.templateMatrix = None
+        self.templateEnergies = None
+        self.templateIndex = None
+
     def bestCorrelationMatch(self, image, templates, templateMeans):
         scores = np.zeros(templates.shape[0])
         imageMean = np.mean(image)
@@ -171,9 +349,68 @@ class TMProposalEvaluator(ProposalEvaluator):
 
         return (score > self.threshold), score
 
+    @profiling.profiled("TMProposalEvaluator.score")
     def score(self, windowImage):
         return self.matcher(windowImage)
 
+    """
+    Scores a batch of windows with shape (N, rows, cols), the size of the templates, returning an array of N scores
+    equal to score() of each window. Templates are flattened (and normalized in cc mode) once, and all windows
+    are compared against all templates with matrix products, in chunks of templates to bound memory.
+    With a template index (see indexTemplates), only the shortlisted templates are compared.
+    """
+    @profiling.profiled("TMProposalEvaluator.scoreBatch")
+    def scoreBatch(self, windowImages):
+        from .templateMatching import normalizedTemplateMatrix, maxNormalizedCrossCorrelationBatch
+        from .templateMatching import squareDifferenceTemplateMatrix, minNormalizedSquareDifferenceBatch
+
+        if self.mode == "sqd":
+            if self.templateMatrix is None:
+                self.templateMatrix, self.templateEnergies = squareDifferenceTemplateMatrix(self.positiveTemplates)
+
+            return 1.0 - minNormalizedSquareDifferenceBatch(windowImages, self.templateMatrix, self.templateEnergies)
+
+        if self.templateIndex is not None:
+            return self.templateIndex.scoreBatch(windowImages)
+
+        if self.templateMatrix is None:
+            self.templateMatrix = normalizedTemplateMatrix(self.positiveTemplates)
+
+        return maxNormalizedCrossCorrelationBatch(windowImages, self.templateMatrix)
+
+    def evaluateBatch(self, windowImages):
+        scores = self.scoreBatch(windowImages)
+
+        return scores > self.threshold, scores
+
+    """
+    Builds a TemplateIndex over the templates, which scoreBatch then uses instead of comparing windows to every template.
+    Only for cc mode. Returns the index, so its recall can be checked with compareTemplateIndex.
+    """
+    def indexTemplates(self, components = 32, clusters = None, probes = 4, shortlistSize = 16):
+        from .templateMatching import TemplateIndex
+
+        if self.mode != "cc":
+            raise ValueError("Template indexing is only available in cc mode")
+
+        self.templateIndex = TemplateIndex(self.positiveTemplates, components, clusters, probes, shortlistSize)
+
+        return self.templateIndex
+
+    """
+    Scores all windows of the image with the size of the templates at once, with FFT based correlation.
+    Returns a 2D array whose element (i, j) is the score() of the window with top left corner
+    (i * stride, j * stride). Only available in cc mode.
+    """
+    @profiling.profiled("TMProposalEvaluator.denseScores")
+    def denseScores(self, image, stride = 8):
+        from .templateMatching import maxNormalizedCrossCorrelationMap
+
+        if self.mode != "cc":
+            raise ValueError("Dense scores are only available in cc mode")
+
+        return maxNormalizedCrossCorrelationMap(image, self.positiveTemplates)[::stride, ::stride]
+
     def resizeAndScore(self, image):
         resizedImage = None
 
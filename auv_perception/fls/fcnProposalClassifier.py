@@ -1,35 +1,245 @@
 #!/usr/bin/env python3
 
+import os
+
 import numpy as np
-import keras
 
-from keras.models import model_from_json
-from scipy.ndimage.interpolation import zoom
+from .sharedModels import modelRegistry
+from .objectnessMap import ObjectnessMap
+from .. import profiling
 
+"""
+Scores whole images with a fully convolutional objectness network.
+The model is loaded once per process through the modelRegistry, and its summary is printed
+when it is loaded if verbose is True.
+Large images can be processed in tiles to bound memory, with tiles of tileSize pixels per side,
+or as large as fit in memoryBudget bytes of activations. Tiled and whole-image responses are the same.
+memoryBudget bounds the activations of every predict call, also when several frames are batched together.
+"""
 class FCNProposalScorer:
     def __init__(self, modelJSONFile = "../../data/proposalFCNScore-modules2-model.json",
-                     hdf5WeightsFile = "../../data/proposalFCNScore-modules2-weights.hdf5"):
+                     hdf5WeightsFile = "../../data/proposalFCNScore-modules2-weights.hdf5", verbose = False,
+                     tileSize = None, memoryBudget = None):
 
-        with open(modelJSONFile, "rt") as jsonFile:
-            jsonString = jsonFile.read()
+        def loadModel():
+            from keras.models import model_from_json
 
-        self.model = model_from_json(jsonString)
-        self.model.load_weights(hdf5WeightsFile)
+            with open(modelJSONFile, "rt") as jsonFile:
+                jsonString = jsonFile.read()
 
-        #Required because I am using an old Keras version
-        self.model.compile(loss = "mse", optimizer = "adam")
+            model = model_from_json(jsonString)
+            model.load_weights(hdf5WeightsFile)
 
-        self.model.summary()
+            #Required because I am using an old Keras version
+            model.compile(loss = "mse", optimizer = "adam")
+
+            if verbose:
+                model.summary()
+
+            return model
+
+        architecture = "FCNProposalScorer/{}".format(os.path.abspath(modelJSONFile))
+        self.model = modelRegistry.load(architecture, hdf5WeightsFile, loadModel, extraFiles = [modelJSONFile])
+
+        self.tileSize = tileSize
+        self.memoryBudget = memoryBudget
+        self.geometry = None
+
+    """
+    Size of the tiles used for an image of the given shape, or None to process it whole.
+    """
+    def tileSizeFor(self, imageShape):
+        from .tiledInference import networkGeometry, tileSizeForBudget
+
+        if self.tileSize is None and self.memoryBudget is None:
+            return None
+
+        if self.geometry is None:
+            self.geometry = networkGeometry(self.model)
+
+        tileSize = self.tileSize
+
+        if self.memoryBudget is not None:
+            budgetTileSize = tileSizeForBudget(self.memoryBudget, *self.geometry)
+            tileSize = budgetTileSize if tileSize is None else min(tileSize, budgetTileSize)
+
+        if tileSize >= max(imageShape):
+            return None
+
+        return tileSize
+
+    """
+    Native resolution response of the network for a 2D image, as a 2D array.
+    """
+    def response(self, image):
+        from .tiledInference import tiledPredict
 
-    def scoreImage(self, image):
         assert(len(image.shape) == 2)
 
-        fcnInput = image.reshape((1, 1, image.shape[0], image.shape[1]))
-        fcnResponse = self.model.predict(fcnInput)[0]
-        fcnResponse = fcnResponse.reshape((fcnResponse.shape[1], fcnResponse.shape[2]))
+        tileSize = self.tileSizeFor(image.shape)
+
+        with profiling.stage("FCNProposalScorer.predict"):
+            if tileSize is not None:
+                stride, receptiveField, channelDensity = self.geometry
+                return tiledPredict(self.model, image, stride, receptiveField, tileSize)
+
+            fcnInput = image.reshape((1, 1, image.shape[0], image.shape[1]))
+            fcnResponse = self.model.predict(fcnInput)[0]
+
+        return fcnResponse.reshape((fcnResponse.shape[1], fcnResponse.shape[2]))
+
+    """
+    Number of images of the given shape to predict together, batchSize reduced so their activations fit
+    in memoryBudget, if set.
+    """
+    def batchSizeFor(self, imageShape, batchSize):
+        from .tiledInference import networkGeometry, batchSizeForBudget
+
+        if self.memoryBudget is None:
+            return batchSize
+
+        if self.geometry is None:
+            self.geometry = networkGeometry(self.model)
+
+        return min(batchSize, batchSizeForBudget(self.memoryBudget, imageShape, self.geometry[2]))
+
+    """
+    Native resolution responses for a sequence of 2D images (or a (n, H, W) array), as a list of 2D arrays.
+    Images of the same shape go through the network together, in batches of batchSize images, or fewer
+    if that many do not fit in memoryBudget. Images large enough to need tiling are processed one by one.
+    """
+    def responses(self, images, batchSize = 8):
+        groups = {}
+
+        for i, image in enumerate(images):
+            assert(len(image.shape) == 2)
+            groups.setdefault(image.shape, []).append(i)
+
+        results = [None] * len(images)
+
+        for shape, indices in groups.items():
+            if self.tileSizeFor(shape) is not None:
+                for i in indices:
+                    results[i] = self.response(images[i])
+
+                continue
+
+            shapeBatchSize = self.batchSizeFor(shape, batchSize)
+
+            #Images are stacked one batch at a time, so only a batch of inputs is copied
+            for start in range(0, len(indices), shapeBatchSize):
+                batchIndices = indices[start:start + shapeBatchSize]
+                fcnInput = np.stack([images[i] for i in batchIndices])[:, np.newaxis]
+
+                with profiling.stage("FCNProposalScorer.predict"):
+                    fcnResponses = self.model.predict(fcnInput, batch_size = shapeBatchSize)[:, 0]
+
+                for i, fcnResponse in zip(batchIndices, fcnResponses):
+                    results[i] = fcnResponse
+
+        return results
+
+    """
+    Upsamples a native resolution response to the given image shape, with bilinear interpolation.
+    """
+    def upsampleResponse(self, fcnResponse, imageShape):
+        from scipy.ndimage import zoom
+
+        zoomFactor = (imageShape[0] / fcnResponse.shape[0], imageShape[1] / fcnResponse.shape[1])
+
+        with profiling.stage("FCNProposalScorer.zoom"):
+            return zoom(fcnResponse, zoom = zoomFactor, order = 1)
+
+    @profiling.profiled("FCNProposalScorer.scoreImage")
+    def scoreImage(self, image):
+        return self.upsampleResponse(self.response(image), image.shape)
+
+    """
+    Objectness maps for a sequence of 2D images (or a (n, H, W) array), scoring images of the same shape
+    in batches (see responses). Returns a (n, H, W) array if all images have the same shape, else a list of maps.
+    """
+    @profiling.profiled("FCNProposalScorer.scoreImages")
+    def scoreImages(self, images, batchSize = 8):
+        fcnResponses = self.responses(images, batchSize)
+        objectnessMaps = [self.upsampleResponse(r, image.shape) for r, image in zip(fcnResponses, images)]
+
+        if len(set(image.shape for image in images)) == 1:
+            return np.stack(objectnessMaps)
+
+        return objectnessMaps
+
+    """
+    Objectness map of an image that keeps the native resolution response and interpolates only the values
+    that are read, with the same values as scoreImage. Use it instead of scoreImage when only some positions
+    are needed, as in generateObjectnessMapDetections*.
+    """
+    @profiling.profiled("FCNProposalScorer.objectnessMap")
+    def objectnessMap(self, image):
+        return ObjectnessMap(self.response(image), image.shape)
+
+    """
+    Lazy objectness maps (see objectnessMap) for a sequence of images, scored in batches as in scoreImages.
+    """
+    def objectnessMaps(self, images, batchSize = 8):
+        return [ObjectnessMap(r, image.shape) for r, image in zip(self.responses(images, batchSize), images)]
+
+    """
+    Multi-scale version of generateObjectnessMapDetectionsArray. For each window size from minWindowSize to
+    maxWindowSize (as in generateProposals), the image is resized so that windows of that size become
+    windowSize x windowSize (the window size the network was trained on), and the network scores the resized image.
+    Levels of the same shape are scored in the same batch. Windows are slid over the original image, and each
+    window takes the objectness at its center in the level of its size, so all boxes are in image coordinates.
+    Returns a tuple (boxes, scores), sorted by decreasing objectness, with boxes as [left, top, right, bottom] rows.
+    """
+    @profiling.profiled("FCNProposalScorer.multiScaleDetections")
+    def multiScaleDetections(self, image, threshold = 0.5, minWindowSize = 96, maxWindowSize = 96, scaleFactor = 1.5,
+                             aspectRatios = [1.0], stepSize = 8, doNMS = False, nmsThresh = 0.5, windowSize = 96,
+                             polarMask = None):
+        from .objectProposals import proposalWindowSizes, nonMaximumSupressionArray
+        from ..sonar import extractPolarMask, polarSlidingWindowPositions
+        from ..compat import imresize
+
+        if polarMask is None:
+            polarMask = extractPolarMask(image)
+
+        windowSizes = proposalWindowSizes(minWindowSize, maxWindowSize, scaleFactor, aspectRatios)
+        levels = []
+
+        for window in windowSizes:
+            levelShape = (int(round(image.shape[0] * windowSize / window[0])), int(round(image.shape[1] * windowSize / window[1])))
+
+            if levelShape == image.shape:
+                levels.append(image)
+            else:
+                #PIL sizes are (width, height), that is (cols, rows)
+                levels.append(imresize(np.asarray(image, dtype = np.float32), (levelShape[1], levelShape[0]), interp = "bilinear"))
+
+        boxes = []
+        scores = []
+
+        for window, level, levelMap in zip(windowSizes, levels, self.objectnessMaps(levels)):
+            positions = polarSlidingWindowPositions(image.shape, window, polarMask, stepSize = stepSize)
+            centers = positions + np.array([window[0] // 2, window[1] // 2])
+
+            #Centers in level coordinates
+            x = np.minimum(np.rint(centers[:, 0] * (level.shape[0] / image.shape[0])).astype(np.int64), level.shape[0] - 1)
+            y = np.minimum(np.rint(centers[:, 1] * (level.shape[1] / image.shape[1])).astype(np.int64), level.shape[1] - 1)
+
+            boxes.append(np.concatenate([positions, positions + np.array(window)], axis = 1))
+            scores.append(np.asarray(levelMap[x, y]).reshape(-1))
+
+        boxes = np.concatenate(boxes, axis = 0)
+        scores = np.concatenate(scores)
+
+        selected = np.flatnonzero(scores >= threshold)
+        selected = selected[np.argsort(-scores[selected], kind = "stable")]
 
-        zoomFactor = (image.shape[0] / fcnResponse.shape[0], image.shape[1] / fcnResponse.shape[1])
+        boxes = boxes[selected]
+        scores = scores[selected]
 
-        objectnessMap = zoom(fcnResponse, zoom = zoomFactor, order = 1)
+        if doNMS:
+            keep = nonMaximumSupressionArray(boxes, scores, nmsThresh)
+            boxes = boxes[keep]
+            scores = scores[keep]
 
-        return objectnessMap
+        return boxes, scores
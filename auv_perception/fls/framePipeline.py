@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+import time
+
+from .. import profiling
+
+#Marks the end of the input in the queues between stages
+END_OF_INPUT = object()
+
+"""
+Wraps an exception raised by a stage, so it reaches the consumer of the pipeline through the queues.
+"""
+class StageError:
+    def __init__(self, stageName, exception):
+        self.stageName = stageName
+        self.exception = exception
+
+#Queue operations wake up periodically, so threads notice when the consumer stops the pipeline early
+POLL_SECONDS = 0.1
+
+def putUnlessStopped(outputQueue, item, stopped):
+    while not stopped.is_set():
+        try:
+            outputQueue.put(item, timeout = POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+def getUnlessStopped(inputQueue, stopped):
+    while not stopped.is_set():
+        try:
+            return inputQueue.get(timeout = POLL_SECONDS)
+        except queue.Empty:
+            continue
+
+    return END_OF_INPUT
+
+"""
+A pipeline stage, running function on each item in its own thread, reading from an input queue and writing to an output queue.
+Keeps the metrics of the stage: items processed, time spent processing them, and the depth of its input queue.
+"""
+class PipelineStage:
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+        self.resetMetrics()
+
+    def resetMetrics(self):
+        self.items = 0
+        self.busySeconds = 0.0
+        self.maxSeconds = 0.0
+        self.queueDepthSum = 0
+        self.maxQueueDepth = 0
+
+    def run(self, inputQueue, outputQueue, stopped):
+        while True:
+            #Queue depth is sampled every time the stage takes an item
+            depth = inputQueue.qsize()
+            item = getUnlessStopped(inputQueue, stopped)
+
+            if item is END_OF_INPUT or isinstance(item, StageError):
+                putUnlessStopped(outputQueue, item, stopped)
+                break
+
+            self.queueDepthSum += depth
+            self.maxQueueDepth = max(self.maxQueueDepth, depth)
+
+            start = time.perf_counter()
+
+            try:
+                with profiling.stage("pipeline." + self.name):
+                    result = self.function(item)
+            except Exception as e:
+                putUnlessStopped(outputQueue, StageError(self.name, e), stopped)
+                break
+
+            elapsed = time.perf_counter() - start
+            self.items += 1
+            self.busySeconds += elapsed
+            self.maxSeconds = max(self.maxSeconds, elapsed)
+
+            if not putUnlessStopped(outputQueue, result, stopped):
+                break
+
+    def metrics(self, wallSeconds):
+        return {"items": self.items,
+                "meanSeconds": self.busySeconds / self.items if self.items > 0 else 0.0,
+                "maxSeconds": self.maxSeconds,
+                "busyFraction": self.busySeconds / wallSeconds if wallSeconds > 0 else 0.0,
+                "meanQueueDepth": self.queueDepthSum / self.items if self.items > 0 else 0.0,
+                "maxQueueDepth": self.maxQueueDepth}
+
+"""
+Runs a sequence of stages over a stream of items, with each stage in its own thread and bounded queues
+between stages, so different items are processed by different stages at the same time (for example reading
+frame i + 2 while preprocessing frame i + 1 and running inference on frame i).
+Stages are (name, function) pairs, each function takes the output of the previous stage.
+Throughput approaches that of the slowest stage, as long as stages release the GIL (I/O, NumPy, Keras).
+Outputs keep the order of the inputs. Each queue holds at most queueSize items, which bounds memory.
+"""
+class FramePipeline:
+    def __init__(self, stages, queueSize = 4):
+        self.stages = [PipelineStage(name, function) for name, function in stages]
+        self.queueSize = queueSize
+        self.wallSeconds = 0.0
+
+    """
+    Feeds the inputs through the pipeline, yielding the output of the last stage for each of them.
+    An exception raised by a stage or by the input iterable is raised here, after stopping the pipeline.
+    """
+    def run(self, inputs):
+        queues = [queue.Queue(maxsize = self.queueSize) for i in range(len(self.stages) + 1)]
+        stopped = threading.Event()
+
+        for stage in self.stages:
+            stage.resetMetrics()
+
+        def feed():
+            try:
+                for item in inputs:
+                    if not putUnlessStopped(queues[0], item, stopped):
+                        return
+            except Exception as e:
+                #Errors of the input iterable reach the consumer like those of the stages
+                putUnlessStopped(queues[0], StageError("input", e), stopped)
+                return
+
+            putUnlessStopped(queues[0], END_OF_INPUT, stopped)
+
+        threads = [threading.Thread(target = feed, daemon = True)]
+
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(target = stage.run, args = (queues[i], queues[i + 1], stopped), daemon = True))
+
+        start = time.perf_counter()
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = getUnlessStopped(queues[-1], stopped)
+                self.wallSeconds = time.perf_counter() - start
+
+                if item is END_OF_INPUT:
+                    break
+
+                if isinstance(item, StageError):
+                    raise item.exception
+
+                yield item
+        finally:
+            #Lets all threads exit, also when the consumer stops iterating early
+            stopped.set()
+
+    """
+    Per stage metrics of the last run, as a dictionary indexed by stage name: items processed, mean and maximum
+    processing time per item, fraction of the wall time the stage was busy, and mean and maximum depth of its input queue.
+    The stage with the highest busy fraction is the bottleneck.
+    """
+    def metrics(self):
+        return {stage.name: stage.metrics(self.wallSeconds) for stage in self.stages}
+
+"""
+Builds the typical proposal pipeline over an ARIS file: read frames, optional preprocessing of each image
+(a function taking and returning an image), generateProposals and non-maximum supression.
+Yields (frameIndex, proposals) when run over frame indices, see FramePipeline.run.
+Any extra keyword arguments are passed to generateProposals.
+"""
+def arisProposalPipeline(arisFile, proposalEvaluator, preprocess = None, nmsThresh = 0.5, queueSize = 4, **proposalArguments):
+    from .objectProposals import generateProposals, nonMaximumSupression
+
+    stages = [("read", lambda frameIndex: (frameIndex, arisFile.frame(frameIndex).numpyImage()))]
+
+    if preprocess is not None:
+        stages.append(("preprocess", lambda item: (item[0], preprocess(item[1]))))
+
+    stages.append(("proposals", lambda item: (item[0], generateProposals(item[1], proposalEvaluator, **proposalArguments))))
+    stages.append(("nms", lambda item: (item[0], nonMaximumSupression(item[1], nmsThresh))))
+
+    return FramePipeline(stages, queueSize)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from keras.models import Sequential
+from keras.layers import Activation, BatchNormalization
+from keras.layers import Convolution2D, MaxPooling2D
+
+"""
+Converts a trained sliding window classifier (Convolution2D/MaxPooling2D/BatchNormalization blocks,
+then Flatten and Dense layers, as built by the CNN proposal evaluators) into an equivalent fully convolutional network.
+Models are assumed to use channels first ordering, with input shape (1, rows, cols).
+
+The first Dense layer becomes a convolution with a kernel covering the whole flattened feature map,
+and the following Dense layers become 1x1 convolutions. A final two class softmax is replaced by a sigmoid
+over the difference of both logits, which outputs the probability of class 1.
+The resulting network accepts images of any size, and its output at position (i, j) equals the output of the
+original model on the window with top left corner (i * s, j * s), where s is the product of all pooling sizes.
+
+A BatchNormalization right before Flatten is folded into the first Dense layer, whatever its axis.
+Any other BatchNormalization must normalize the channel axis, as a normalization over a spatial axis
+depends on the position inside the window and cannot be applied convolutionally; a ValueError is raised otherwise.
+This rules out the shipped CNN proposal evaluators, whose inner BatchNormalization layers use the Keras default axis -1
+(the columns of their channels first feature maps); see fullyConvolutionalSupported.
+"""
+def buildFullyConvolutionalModel(model):
+    layers = model.layers
+    fcn = Sequential()
+    inputShape = (model.input_shape[1], None, None)
+
+    #Affine transformation (scale, shift) over the flattened features, from a BatchNormalization before Flatten
+    pendingAffine = None
+    flattenedShape = None
+
+    def addConvolution(kernel, bias, activation):
+        #Only the first layer needs the input shape
+        extraArgs = {"input_shape": inputShape} if len(fcn.layers) == 0 else {}
+
+        fcn.add(Convolution2D(kernel.shape[3], kernel.shape[0], kernel.shape[1], border_mode = 'valid',
+                              activation = activation, **extraArgs))
+        fcn.layers[-1].set_weights([kernel, bias])
+
+    for i, layer in enumerate(layers):
+        layerType = type(layer).__name__
+        config = layer.get_config()
+        nextType = type(layers[i + 1]).__name__ if i + 1 < len(layers) else None
+
+        if layerType in ["Convolution2D", "Conv2D"]:
+            kernel, bias = layer.get_weights()
+            addConvolution(kernel, bias, config["activation"])
+
+        elif layerType == "MaxPooling2D":
+            fcn.add(MaxPooling2D(pool_size = config["pool_size"]))
+
+        elif layerType == "BatchNormalization":
+            gamma, beta, mean, variance = layer.get_weights()
+            scale = gamma / np.sqrt(variance + config["epsilon"])
+            shift = beta - mean * scale
+
+            if nextType == "Flatten":
+                #Broadcast the per-axis parameters to the whole (channels, rows, cols) feature map
+                featureShape = layer.input_shape[1:]
+                axis = config["axis"] % 4 - 1
+                broadcastShape = [1, 1, 1]
+                broadcastShape[axis] = featureShape[axis]
+
+                pendingAffine = (np.broadcast_to(scale.reshape(broadcastShape), featureShape),
+                                 np.broadcast_to(shift.reshape(broadcastShape), featureShape))
+                continue
+
+            axis = config["axis"] % len(layer.input_shape)
+
+            if axis != 1:
+                raise ValueError("BatchNormalization layer {} normalizes axis {}, which is not the channel axis, "
+                                 "so it cannot be made fully convolutional".format(layer.name, config["axis"]))
+
+            fcn.add(BatchNormalization(axis = 1, epsilon = config["epsilon"]))
+            fcn.layers[-1].set_weights([gamma, beta, mean, variance])
+
+        elif layerType == "Flatten":
+            flattenedShape = layer.input_shape[1:]
+
+        elif layerType == "Dense":
+            kernel, bias = layer.get_weights()
+            activation = config["activation"]
+
+            if flattenedShape is not None:
+                #Dense over the flattened (channels, rows, cols) features is a convolution covering the whole feature map
+                kernel = kernel.reshape(tuple(flattenedShape) + (kernel.shape[1],))
+
+                if pendingAffine is not None:
+                    scale, shift = pendingAffine
+                    bias = bias + np.tensordot(shift, kernel, axes = 3)
+                    kernel = kernel * scale[..., np.newaxis]
+                    pendingAffine = None
+
+                kernel = kernel.transpose((1, 2, 0, 3))
+                flattenedShape = None
+            else:
+                kernel = kernel.reshape((1, 1) + kernel.shape)
+
+            if activation == "softmax":
+                if kernel.shape[3] != 2:
+                    raise ValueError("Only two class softmax outputs can be converted, got {} classes".format(kernel.shape[3]))
+
+                kernel = kernel[..., 1:2] - kernel[..., 0:1]
+                bias = bias[1:2] - bias[0:1]
+                activation = "sigmoid"
+
+            addConvolution(kernel, bias, activation)
+
+        elif layerType == "Activation":
+            fcn.add(Activation(config["activation"]))
+
+        elif layerType == "Dropout":
+            continue
+
+        else:
+            raise ValueError("Layer {} of type {} cannot be made fully convolutional".format(layer.name, layerType))
+
+    fcn.compile(loss = "mse", optimizer = "adam")
+
+    return fcn
+
+"""
+True if buildFullyConvolutionalModel can convert the model, without building it.
+"""
+def fullyConvolutionalSupported(model):
+    layers = model.layers
+
+    for i, layer in enumerate(layers):
+        layerType = type(layer).__name__
+        config = layer.get_config()
+        nextType = type(layers[i + 1]).__name__ if i + 1 < len(layers) else None
+
+        if layerType not in ["Convolution2D", "Conv2D", "MaxPooling2D", "BatchNormalization", "Flatten", "Dense",
+                             "Activation", "Dropout"]:
+            return False
+
+        if layerType == "BatchNormalization" and nextType != "Flatten" and config["axis"] % len(layer.input_shape) != 1:
+            return False
+
+        if layerType == "Dense" and config["activation"] == "softmax" and layer.get_weights()[0].shape[1] != 2:
+            return False
+
+    return True
+
+"""
+Product of the pooling sizes of a model, which is the stride between outputs of its fully convolutional version.
+"""
+def fullyConvolutionalStride(model):
+    stride = 1
+
+    for layer in model.layers:
+        if type(layer).__name__ == "MaxPooling2D":
+            stride *= layer.get_config()["pool_size"][0]
+
+    return stride
+
+"""
+Runs a fully convolutional model built by buildFullyConvolutionalModel over a whole 2D image, in one forward pass.
+Returns a 2D array whose element (i, j) is the output for the window with top left corner (i * stride, j * stride).
+The stride must be a multiple of the network stride.
+"""
+def denseWindowScores(fcnModel, networkStride, image, stride):
+    if stride % networkStride != 0:
+        raise ValueError("stride must be a multiple of the network stride {}, got {}".format(networkStride, stride))
+
+    fcnInput = image.reshape((1, 1, image.shape[0], image.shape[1]))
+    fcnResponse = fcnModel.predict(fcnInput, batch_size = 1)[0, 0]
+
+    step = stride // networkStride
+
+    return fcnResponse[::step, ::step]
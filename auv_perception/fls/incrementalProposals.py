@@ -0,0 +1,137 @@
+from ..sonar import extractPolarMask, polarSlidingWindow
+from .objectProposals import proposalWindowSizes, scoreWindows, nonMaximumSupression
+
+import numpy as np
+
+"""
+Generates proposals over a sequence of sonar frames, exploiting that consecutive frames are highly correlated.
+A full dense search over the polar field of view is only done on keyframes, which happen every keyframeInterval
+frames, or when a scene change is detected. On the frames in between, only windows whose center lies within
+searchRadius pixels (in each axis) of a proposal that survived on the previous frame are evaluated.
+An optional ProposalCascade filters the candidate windows before they reach the proposal evaluator.
+
+A scene change is detected when the mean absolute intensity difference with the previous frame, normalized to [0, 1],
+is larger than sceneChangeThreshold. Frames are assumed to be 8-bit images.
+"""
+class IncrementalProposalGenerator:
+    def __init__(self, proposalEvaluator, keyframeInterval = 10, searchRadius = 16, sceneChangeThreshold = 0.1,
+                 minWindowSize = 96, maxWindowSize = 96, scaleFactor = 1.5, aspectRatios = [1.0], stepSize = 8,
+                 doNMS = False, nmsThresh = 0.5, cascade = None):
+
+        if keyframeInterval < 1:
+            raise ValueError("keyframeInterval must be at least 1")
+
+        self.proposalEvaluator = proposalEvaluator
+        self.keyframeInterval = keyframeInterval
+        self.searchRadius = searchRadius
+        self.sceneChangeThreshold = sceneChangeThreshold
+
+        self.windowSizes = proposalWindowSizes(minWindowSize, maxWindowSize, scaleFactor, aspectRatios)
+        self.stepSize = stepSize
+        self.doNMS = doNMS
+        self.nmsThresh = nmsThresh
+        self.cascade = cascade
+
+        self.reset()
+
+    def reset(self):
+        self.framesSinceKeyframe = 0
+        self.previousShape = None
+        self.previousThumbnail = None
+        self.previousProposals = []
+
+        #Candidate windows for each window size, and their centers, computed on the last keyframe
+        self.candidateWindows = []
+        self.candidateCenters = []
+
+        self.lastFrameWasKeyframe = False
+        self.lastEvaluatorCalls = 0
+
+    #Frames are compared subsampled, a coarse comparison is enough to detect a scene change
+    def thumbnail(self, image):
+        return image[::4, ::4].astype(np.float32)
+
+    def isSceneChange(self, image):
+        if self.previousShape != image.shape:
+            return True
+
+        difference = np.mean(np.abs(self.thumbnail(image) - self.previousThumbnail)) / 255.0
+
+        return difference > self.sceneChangeThreshold
+
+    def updateCandidateWindows(self, image):
+        mask = extractPolarMask(image)
+
+        self.candidateWindows = []
+        self.candidateCenters = []
+
+        for window in self.windowSizes:
+            candidates = polarSlidingWindow(image.shape, window, mask, stepSize = self.stepSize)
+            centers = np.array([cw.center for cw in candidates], dtype = np.int64).reshape((-1, 2))
+
+            self.candidateWindows.append(candidates)
+            self.candidateCenters.append(centers)
+
+    def neighborhoodWindows(self, imageShape):
+        if len(self.previousProposals) == 0:
+            return []
+
+        #Integral image of the previous proposal centers, so counting the centers
+        #inside the neighborhood of a candidate is constant time
+        centerMap = np.zeros((imageShape[0] + 1, imageShape[1] + 1), dtype = np.int32)
+
+        for window, score in self.previousProposals:
+            x, y = window.center
+            centerMap[x + 1, y + 1] += 1
+
+        centerCounts = centerMap.cumsum(axis = 0).cumsum(axis = 1)
+        r = self.searchRadius
+        windows = []
+
+        for candidates, centers in zip(self.candidateWindows, self.candidateCenters):
+            if len(candidates) == 0:
+                continue
+
+            x0 = np.clip(centers[:, 0] - r, 0, imageShape[0])
+            x1 = np.clip(centers[:, 0] + r + 1, 0, imageShape[0])
+            y0 = np.clip(centers[:, 1] - r, 0, imageShape[1])
+            y1 = np.clip(centers[:, 1] + r + 1, 0, imageShape[1])
+
+            counts = centerCounts[x1, y1] - centerCounts[x0, y1] - centerCounts[x1, y0] + centerCounts[x0, y0]
+
+            windows += [candidates[i] for i in np.flatnonzero(counts > 0)]
+
+        return windows
+
+    """
+    Generates the proposals for the next frame in the sequence, returning a list of (window, score).
+    """
+    def generate(self, image):
+        isKeyframe = (self.framesSinceKeyframe % self.keyframeInterval == 0) or self.isSceneChange(image)
+
+        if isKeyframe:
+            self.updateCandidateWindows(image)
+            self.framesSinceKeyframe = 0
+
+            candidateWindows = [cw for candidates in self.candidateWindows for cw in candidates]
+        else:
+            candidateWindows = self.neighborhoodWindows(image.shape)
+
+        if self.cascade is not None:
+            self.cascade.prepare(image)
+            candidateWindows = self.cascade.filterWindows(candidateWindows)
+
+        scoredProposals = scoreWindows(image, candidateWindows, self.proposalEvaluator)
+
+        if self.doNMS:
+            scoredProposals = nonMaximumSupression(scoredProposals, self.nmsThresh)
+
+        self.framesSinceKeyframe += 1
+        self.previousShape = image.shape
+        self.previousThumbnail = self.thumbnail(image)
+        self.previousProposals = scoredProposals
+
+        self.lastFrameWasKeyframe = isKeyframe
+        self.lastEvaluatorCalls = len(candidateWindows)
+
+        return scoredProposals
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import queue
+import threading
+import time
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+from .objectProposals import ProposalEvaluator
+
+"""
+Evaluates a batch of windows with any proposal evaluator, returning (decisions, scores) arrays.
+Uses evaluateBatch if the evaluator has it, else scoreBatch compared against the evaluator threshold,
+else evaluate on each window.
+"""
+def evaluateWindows(evaluator, windows):
+    if hasattr(evaluator, "evaluateBatch"):
+        decisions, scores = evaluator.evaluateBatch(windows)
+    elif hasattr(evaluator, "scoreBatch"):
+        scores = evaluator.scoreBatch(windows)
+        decisions = scores > evaluator.threshold
+    else:
+        results = [evaluator.evaluate(window) for window in windows]
+        decisions = [decision for decision, score in results]
+        scores = [score for decision, score in results]
+
+    return np.asarray(decisions, dtype = bool), np.asarray(scores, dtype = np.float64)
+
+"""
+Serves a proposal evaluator to many client processes, so a single copy of the model is loaded.
+The address is a path for a Unix socket, or a (host, port) tuple for TCP (use "localhost").
+Window requests from all clients are gathered into micro-batches: a batch is evaluated as soon as it holds
+maxBatchSize windows, or maxLatency seconds after its first request arrived, whichever comes first.
+Clients connect with RemoteProposalEvaluator.
+Requests are unpickled, so connections are always authenticated: authkey defaults to the authkey of the current
+process, as in multiprocessing, which child processes inherit. Clients started otherwise must be given the same authkey.
+The authentication handshake of each client runs in its own thread, and clients that do not complete it within
+handshakeTimeout seconds are dropped, so a stalled client does not block others.
+"""
+class InferenceServer:
+    def __init__(self, evaluator, address, maxBatchSize = 256, maxLatency = 0.005, authkey = None, handshakeTimeout = 5.0):
+        self.evaluator = evaluator
+        self.maxBatchSize = maxBatchSize
+        self.maxLatency = maxLatency
+        self.handshakeTimeout = handshakeTimeout
+
+        if authkey is None:
+            authkey = multiprocessing.current_process().authkey
+
+        #The listener does not authenticate, so accept does not wait on clients; each handshake runs in authenticate
+        self.authkey = bytes(authkey)
+        self.listener = Listener(address)
+        self.address = self.listener.address
+        self.requests = queue.Queue()
+        self.running = False
+        self.threads = []
+        self.connections = []
+
+        #Served batches and windows, to check the batching efficiency
+        self.batchCount = 0
+        self.windowCount = 0
+
+    def start(self):
+        self.running = True
+
+        for target in [self.acceptLoop, self.batchLoop]:
+            thread = threading.Thread(target = target, daemon = True)
+            thread.start()
+            self.threads.append(thread)
+
+        return self
+
+    def close(self):
+        self.running = False
+        self.requests.put(None)
+        self.listener.close()
+
+        for connection, lock in self.connections:
+            connection.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def meanBatchSize(self):
+        return self.windowCount / self.batchCount if self.batchCount > 0 else 0.0
+
+    def acceptLoop(self):
+        while self.running:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                break
+
+            threading.Thread(target = self.authenticate, args = (connection,), daemon = True).start()
+
+    """
+    Runs the multiprocessing authentication handshake with a new client, as Listener does with an authkey,
+    but giving up after handshakeTimeout seconds. Authenticated clients are served by readLoop in this thread.
+    """
+    def authenticate(self, connection):
+        from multiprocessing.connection import deliver_challenge, answer_challenge
+
+        #Both sides of the handshake wait for a message, so a timer closes the connection of a stalled client
+        timer = threading.Timer(self.handshakeTimeout, connection.close)
+        timer.start()
+
+        try:
+            deliver_challenge(connection, self.authkey)
+            answer_challenge(connection, self.authkey)
+        except (AuthenticationError, EOFError, OSError):
+            #Clients with the wrong authkey, or that stall, are dropped
+            connection.close()
+            return
+        finally:
+            timer.cancel()
+
+        if not self.running:
+            connection.close()
+            return
+
+        #Replies from the batching thread and errors from the reader thread may be sent concurrently
+        client = (connection, threading.Lock())
+        self.connections.append(client)
+
+        self.readLoop(client)
+
+    def readLoop(self, client):
+        connection, lock = client
+
+        while self.running:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+            except Exception as e:
+                #A message that cannot be unpickled leaves the connection usable, the client gets the error
+                self.reply(client, (None, ValueError("Invalid request: {!r}".format(e))))
+                continue
+
+            try:
+                requestId, windows = message
+                windows = np.asarray(windows)
+
+                if windows.ndim < 1:
+                    raise ValueError("Windows must be an array of windows, got shape {}".format(windows.shape))
+            except Exception as e:
+                self.reply(client, (message[0] if isinstance(message, tuple) and len(message) > 0 else None,
+                                    ValueError("Invalid request: {!r}".format(e))))
+                continue
+
+            self.requests.put((client, requestId, windows))
+
+    def reply(self, client, message):
+        connection, lock = client
+
+        try:
+            with lock:
+                connection.send(message)
+        except (EOFError, OSError):
+            #The client went away, its results are dropped
+            pass
+        except Exception as e:
+            #The result or error cannot be pickled, the client gets a plain error in its place
+            requestId = message[0]
+
+            try:
+                with lock:
+                    connection.send((requestId, RuntimeError("Cannot send the reply: {!r}".format(e))))
+            except Exception:
+                pass
+
+    def nextBatch(self):
+        first = self.requests.get()
+
+        if first is None:
+            return None
+
+        batch = [first]
+        windowCount = len(first[2])
+        deadline = time.monotonic() + self.maxLatency
+
+        while windowCount < self.maxBatchSize:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                break
+
+            try:
+                request = self.requests.get(timeout = remaining)
+            except queue.Empty:
+                break
+
+            if request is None:
+                self.requests.put(None)
+                break
+
+            batch.append(request)
+            windowCount += len(request[2])
+
+        return batch
+
+    def batchLoop(self):
+        while self.running:
+            batch = self.nextBatch()
+
+            if batch is None:
+                break
+
+            #Requests are grouped by window shape, as each group is evaluated as one array
+            groups = {}
+
+            for request in batch:
+                groups.setdefault(request[2].shape[1:], []).append(request)
+
+            for group in groups.values():
+                self.evaluateGroup(group)
+
+    """
+    Evaluates a group of requests with windows of the same shape as one batch, and replies to each of them.
+    Any error is sent to the clients of the group instead, so the batching thread keeps serving.
+    """
+    def evaluateGroup(self, group):
+        try:
+            decisions, scores = evaluateWindows(self.evaluator, np.concatenate([request[2] for request in group]))
+        except Exception as e:
+            for client, requestId, windows in group:
+                self.reply(client, (requestId, e))
+
+            return
+
+        self.batchCount += 1
+        self.windowCount += len(scores)
+        start = 0
+
+        for client, requestId, windows in group:
+            end = start + len(windows)
+            self.reply(client, (requestId, (decisions[start:end], scores[start:end])))
+            start = end
+
+"""
+Proposal evaluator that forwards windows to an InferenceServer, with the same evaluate, score and
+scoreBatch interface as a local evaluator. Decisions are taken on the server, by the served evaluator.
+It can be shared between threads of a client process. authkey defaults to the authkey of the current process,
+see InferenceServer.
+"""
+class RemoteProposalEvaluator(ProposalEvaluator):
+    def __init__(self, address, authkey = None):
+        if authkey is None:
+            authkey = multiprocessing.current_process().authkey
+
+        self.connection = Client(address, authkey = authkey)
+        self.lock = threading.Lock()
+        self.nextRequestId = 0
+
+    def close(self):
+        self.connection.close()
+
+    """
+    Evaluates a batch of windows with shape (N, rows, cols) on the server, returning (decisions, scores) arrays.
+    Errors raised by the evaluator on the server are raised here.
+    """
+    def evaluateBatch(self, windowImages):
+        with self.lock:
+            requestId = self.nextRequestId
+            self.nextRequestId += 1
+
+            self.connection.send((requestId, np.asarray(windowImages)))
+            replyId, result = self.connection.recv()
+
+        #Requests the server could not read are answered without an id
+        if replyId is None and isinstance(result, Exception):
+            raise result
+
+        if replyId != requestId:
+            raise ValueError("Got the reply to request {} while waiting for request {}".format(replyId, requestId))
+
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+
+    def scoreBatch(self, windowImages):
+        return self.evaluateBatch(windowImages)[1]
+
+    def evaluate(self, windowImage):
+        decisions, scores = self.evaluateBatch(windowImage[np.newaxis])
+
+        return decisions[0], scores[0]
+
+    def score(self, windowImage):
+        return self.evaluate(windowImage)[1]
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+"""
+Pure NumPy inference for the small sequential CNNs used by the proposal evaluators, so they can run without Keras.
+Layers mirror the Keras layers used in buildKerasModel (Convolution2D with valid padding, MaxPooling2D,
+BatchNormalization in inference mode, Flatten and Dense), with channels first ordering,
+and weights are loaded from the same hdf5 files through h5py.
+"""
+
+def relu(x):
+    return np.maximum(x, 0.0)
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def softmax(x):
+    e = np.exp(x - np.max(x, axis = -1, keepdims = True))
+
+    return e / np.sum(e, axis = -1, keepdims = True)
+
+ACTIVATIONS = {"linear": lambda x: x, None: lambda x: x, "relu": relu, "sigmoid": sigmoid, "softmax": softmax}
+
+def activationFunction(name):
+    if name not in ACTIVATIONS:
+        raise ValueError("Unsupported activation: {}".format(name))
+
+    return ACTIVATIONS[name]
+
+"""
+Extracts all kernelSize patches of a (N, C, H, W) array, returning a (N * Ho * Wo, C * kh * kw) matrix (im2col),
+with patches in (channel, row, col) order.
+"""
+def im2col(x, kernelSize):
+    n, c, h, w = x.shape
+    kh, kw = kernelSize
+    ho = h - kh + 1
+    wo = w - kw + 1
+
+    s = x.strides
+    patches = np.lib.stride_tricks.as_strided(x, shape = (n, ho, wo, c, kh, kw),
+                                              strides = (s[0], s[2], s[3], s[1], s[2], s[3]), writeable = False)
+
+    return patches.reshape((n * ho * wo, c * kh * kw))
+
+class NumpyConvolution2D:
+    hasWeights = True
+
+    #Largest im2col matrix built at once, samples are processed in chunks to respect it
+    MAX_IM2COL_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, filters, kernelSize, activation = None):
+        self.filters = filters
+        self.kernelSize = kernelSize
+        self.activation = activationFunction(activation)
+        self.kernel = None
+        self.bias = None
+
+    #Kernels are stored as in Keras 2, with shape (rows, cols, input channels, filters)
+    def setWeights(self, weights):
+        kernel, bias = weights
+
+        self.kernel = kernel.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+
+        #Reorder to match the (channel, row, col) patch order of im2col
+        self.kernelMatrix = self.kernel.transpose((2, 0, 1, 3)).reshape((-1, self.filters))
+
+    def forward(self, x):
+        n, c, h, w = x.shape
+        ho = h - self.kernelSize[0] + 1
+        wo = w - self.kernelSize[1] + 1
+
+        output = np.empty((n, self.filters, ho, wo), dtype = np.float32)
+        patchBytes = ho * wo * self.kernelMatrix.shape[0] * 4
+        chunkSize = max(1, self.MAX_IM2COL_BYTES // max(patchBytes, 1))
+
+        for start in range(0, n, chunkSize):
+            chunk = np.ascontiguousarray(x[start:start + chunkSize])
+            columns = im2col(chunk, self.kernelSize)
+
+            result = np.dot(columns, self.kernelMatrix) + self.bias
+            output[start:start + chunkSize] = result.reshape((len(chunk), ho, wo, self.filters)).transpose((0, 3, 1, 2))
+
+        return self.activation(output)
+
+class NumpyMaxPooling2D:
+    hasWeights = False
+
+    def __init__(self, poolSize = (2, 2)):
+        self.poolSize = poolSize
+
+    def forward(self, x):
+        n, c, h, w = x.shape
+        ph, pw = self.poolSize
+        ho = h // ph
+        wo = w // pw
+
+        x = x[:, :, :ho * ph, :wo * pw].reshape((n, c, ho, ph, wo, pw))
+
+        return x.max(axis = (3, 5))
+
+"""
+Batch normalization in inference mode, with the moving mean and variance.
+As in Keras, axis refers to the axis of the full tensor (including the batch axis), and defaults to the last one.
+"""
+class NumpyBatchNormalization:
+    hasWeights = True
+
+    def __init__(self, axis = -1, epsilon = 1e-3):
+        self.axis = axis
+        self.epsilon = epsilon
+
+    #Weights are (gamma, beta, moving mean, moving variance), as in Keras 2
+    def setWeights(self, weights):
+        gamma, beta, mean, variance = [w.astype(np.float32) for w in weights]
+
+        self.scale = gamma / np.sqrt(variance + self.epsilon)
+        self.shift = beta - mean * self.scale
+
+    def forward(self, x):
+        shape = [1] * x.ndim
+        shape[self.axis] = x.shape[self.axis]
+
+        return x * self.scale.reshape(shape) + self.shift.reshape(shape)
+
+"""
+Flatten as in Keras 2.2 and later: with channels first data, features are moved to the last axis before flattening,
+so they are in (row, col, channel) order. Keras 1 and Keras 2 before 2.2 flattened in the stored (channel, row, col)
+order; legacyOrder keeps that order, for weights trained with those versions (see NumpySequentialModel.loadWeights).
+"""
+class NumpyFlatten:
+    hasWeights = False
+
+    def __init__(self, dataFormat = "channels_first", legacyOrder = False):
+        if dataFormat not in ["channels_first", "channels_last"]:
+            raise ValueError("Invalid data format: {}".format(dataFormat))
+
+        self.dataFormat = dataFormat
+        self.legacyOrder = legacyOrder
+
+    def forward(self, x):
+        if self.dataFormat == "channels_first" and not self.legacyOrder and x.ndim > 2:
+            x = x.transpose((0,) + tuple(range(2, x.ndim)) + (1,))
+
+        return x.reshape((x.shape[0], -1))
+
+class NumpyDense:
+    hasWeights = True
+
+    def __init__(self, units, activation = None):
+        self.units = units
+        self.activation = activationFunction(activation)
+
+    #Kernel has shape (inputs, units), as in Keras
+    def setWeights(self, weights):
+        kernel, bias = weights
+
+        self.kernel = kernel.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+
+    def forward(self, x):
+        return self.activation(np.dot(x, self.kernel) + self.bias)
+
+"""
+Reads the weights of each layer with weights from a hdf5 file written by Keras (save_weights or save),
+returning a list with a list of arrays per layer, in model order.
+"""
+def readKerasWeights(hdf5WeightsFile):
+    import h5py
+
+    layerWeights = []
+
+    with h5py.File(hdf5WeightsFile, "r") as f:
+        group = f["model_weights"] if "model_weights" in f else f
+
+        kerasVersion = group.attrs.get("keras_version", b"2")
+        kerasVersion = kerasVersion.decode("utf-8") if isinstance(kerasVersion, bytes) else str(kerasVersion)
+
+        backend = group.attrs.get("backend", b"")
+        backend = backend.decode("utf-8") if isinstance(backend, bytes) else str(backend)
+
+        for layerName in group.attrs["layer_names"]:
+            layerName = layerName.decode("utf-8") if isinstance(layerName, bytes) else layerName
+            layerGroup = group[layerName]
+            weightNames = layerGroup.attrs["weight_names"]
+
+            if len(weightNames) == 0:
+                continue
+
+            weights = []
+
+            for weightName in weightNames:
+                weightName = weightName.decode("utf-8") if isinstance(weightName, bytes) else weightName
+                weights.append(np.array(layerGroup[weightName]))
+
+            layerWeights.append(weights)
+
+    return layerWeights, kerasVersion, backend
+
+"""
+Converts a convolution kernel saved by Keras 1, with shape (filters, channels, rows, cols), to the Keras 2 layout.
+Theano kernels are flipped, as Theano convolutions are true convolutions and Keras 2 uses correlations.
+"""
+def parseKerasVersion(kerasVersion):
+    parts = []
+
+    for part in kerasVersion.split(".")[:2]:
+        digits = "".join(c for c in part if c.isdigit())
+        parts.append(int(digits) if digits else 0)
+
+    return tuple(parts + [0] * (2 - len(parts)))
+
+def convertLegacyKernel(kernel, backend):
+    kernel = kernel.transpose((2, 3, 1, 0))
+
+    if backend == "theano":
+        kernel = kernel[::-1, ::-1, :, :]
+
+    return kernel
+
+class NumpySequentialModel:
+    def __init__(self, layers):
+        self.layers = layers
+
+    """
+    Loads weights from a Keras hdf5 file. Layers with weights are matched in order.
+    Flatten layers follow the flattening order of the Keras version that saved the weights, which is the order
+    the following Dense layer was trained with (see NumpyFlatten).
+    """
+    def loadWeights(self, hdf5WeightsFile):
+        layerWeights, kerasVersion, backend = readKerasWeights(hdf5WeightsFile)
+        weightedLayers = [layer for layer in self.layers if layer.hasWeights]
+
+        for layer in self.layers:
+            if isinstance(layer, NumpyFlatten):
+                layer.legacyOrder = parseKerasVersion(kerasVersion) < (2, 2)
+
+        if len(layerWeights) != len(weightedLayers):
+            raise ValueError("Weights file {} has weights for {} layers, but the model has {} layers with weights"
+                             .format(hdf5WeightsFile, len(layerWeights), len(weightedLayers)))
+
+        for layer, weights in zip(weightedLayers, layerWeights):
+            if isinstance(layer, NumpyConvolution2D) and kerasVersion.startswith("1"):
+                weights = [convertLegacyKernel(weights[0], backend)] + weights[1:]
+
+            layer.setWeights(weights)
+
+    def forward(self, x):
+        for layer in self.layers:
+            x = layer.forward(x)
+
+        return x
+
+    """
+    Runs the model over a batch of inputs, in chunks of batch_size samples. Same interface as Keras' predict.
+    """
+    def predict(self, x, batch_size = 32):
+        x = np.asarray(x, dtype = np.float32)
+        outputs = []
+
+        for start in range(0, x.shape[0], batch_size):
+            outputs.append(self.forward(x[start:start + batch_size]))
+
+        return np.concatenate(outputs, axis = 0)
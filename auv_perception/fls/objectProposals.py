@@ -1,7 +1,10 @@
 from auv_perception import *
-from ..sonar import extractPolarMask, polarSlidingWindow
+from ..sonar import extractPolarMask, polarSlidingWindow, polarSlidingWindowPositions
 from ..annotation import Rectangle
+from .. import profiling
+import heapq
 import math
+import time
 import numpy as np
 
 class ProposalEvaluator:
@@ -40,6 +43,7 @@ def bestMatch(window, proposalBoxes):
 
     return bestIdx, bestIoU
 
+@profiling.profiled("nonMaximumSupression")
 def nonMaximumSupression(scoredProposals, iouThreshold = 0.4):
     bestBoxes = []
     allBoxes = []
@@ -66,34 +70,203 @@ def nonMaximumSupression(scoredProposals, iouThreshold = 0.4):
     return bestBoxes
 
 
-def generateProposals(image, proposalEvaluator, minWindowSize = 96, maxWindowSize = 96,
-                      scaleFactor = 1.5, aspectRatios = [1.0], stepSize = 8, doNMS = False, nmsThresh = 0.5):
-    mask = extractPolarMask(image)
-    scoredProposals = []
+"""
+Greedy non-maximum supression over arrays. Boxes is a (N, 4) array with the [left, top, right, bottom]
+coordinates of each box (as in Rectangle), and scores is a (N,) array.
+Boxes are visited by decreasing score, and a box is kept if its IoU with all previously kept boxes
+is not larger than iouThreshold. Returns the indices of the kept boxes, by decreasing score.
+IoU is Rectangle.iou (intersection over the enclosing box), as in nonMaximumSupression, so both take the same thresholds.
+"""
+@profiling.profiled("nonMaximumSupressionArray")
+def nonMaximumSupressionArray(boxes, scores, iouThreshold = 0.4):
+    boxes = np.asarray(boxes, dtype = np.float64)
+    order = np.argsort(-np.asarray(scores), kind = "stable")
+    keep = []
+
+    while len(order) > 0:
+        best = order[0]
+        keep.append(best)
+
+        rest = order[1:]
+
+        width = np.clip(np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]), 0, None)
+        height = np.clip(np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]), 0, None)
+        enclosingWidth = np.maximum(boxes[best, 2], boxes[rest, 2]) - np.minimum(boxes[best, 0], boxes[rest, 0])
+        enclosingHeight = np.maximum(boxes[best, 3], boxes[rest, 3]) - np.minimum(boxes[best, 1], boxes[rest, 1])
+        enclosing = enclosingWidth * enclosingHeight
+        iou = width * height / np.where(enclosing > 0, enclosing, 1.0)
+
+        order = rest[iou <= iouThreshold]
+
+    return np.array(keep, dtype = np.int64)
+
+"""
+Enumerates the window sizes used by the multi-scale proposal generators,
+for each aspect ratio starting at minWindowSize and growing by scaleFactor
+until maxWindowSize is exceeded.
+If coarseToFine is True, window sizes are ordered by decreasing area instead, so the largest windows
+(which have the fewest sliding window positions) come first.
+"""
+def proposalWindowSizes(minWindowSize = 96, maxWindowSize = 96, scaleFactor = 1.5, aspectRatios = [1.0],
+                        coarseToFine = False):
+    windowSizes = []
 
     for ar in aspectRatios:
         window = (int(math.floor(minWindowSize)), int(math.floor(minWindowSize * ar)))
         scale = 1
 
         while max(window) <= maxWindowSize:
+            windowSizes.append(window)
 
-            candidateWindows = polarSlidingWindow(image.shape, window, mask, stepSize = stepSize)
+            scale *= scaleFactor
+            window = (int(math.floor(minWindowSize * scale)), int(math.floor(minWindowSize * scale * ar)))
 
-            proposalCount = 0
-            for cw in candidateWindows:
+    if coarseToFine:
+        windowSizes.sort(key = lambda window: window[0] * window[1], reverse = True)
 
-                windowImage = image[cw.left:(cw.right), cw.top:(cw.bottom)]
+    return windowSizes
 
-                decision, score = proposalEvaluator.evaluate(windowImage)
+"""
+Keeps the maxProposals highest scoring proposals added so far, using a bounded min-heap,
+so memory does not grow with the number of added proposals. Proposals are tuples whose second
+element is the score, like (window, score) or (window, score, class). On equal scores, the
+earliest added proposals are kept.
+"""
+class TopProposals:
+    def __init__(self, maxProposals):
+        if maxProposals < 1:
+            raise ValueError("maxProposals must be at least 1")
+
+        self.maxProposals = maxProposals
+        self.heap = []
+        self.added = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def add(self, proposal):
+        #Later proposals compare lower on equal scores, so they are the first to be evicted
+        item = (float(np.squeeze(proposal[1])), -self.added, proposal)
+        self.added += 1
+
+        if len(self.heap) < self.maxProposals:
+            heapq.heappush(self.heap, item)
+        elif item[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, item)
+
+    def extend(self, proposals):
+        for proposal in proposals:
+            self.add(proposal)
+
+    """
+    Returns the kept proposals, sorted by decreasing score.
+    """
+    def proposals(self):
+        return [item[2] for item in sorted(self.heap, key = lambda item: item[:2], reverse = True)]
 
-                if decision:
-                    scoredProposals.append((cw, score))
-                    proposalCount += 1
+"""
+Evaluates each candidate window with the proposal evaluator.
+Returns (window, score) for each window that the evaluator accepts.
+If maxProposals is given, only the maxProposals highest scoring proposals are kept
+(sorted by decreasing score), and memory stays bounded while scoring.
+"""
+def scoreWindows(image, candidateWindows, proposalEvaluator, maxProposals = None):
+    scoredProposals = []
 
-            #print("{} / (max {}) proposals generated at AR {} scale {} window {}".format(proposalCount, len(candidateWindows), ar, scale, window))
+    if maxProposals is not None:
+        scoredProposals = TopProposals(maxProposals)
 
-            scale *= scaleFactor
-            window = (int(math.floor(minWindowSize * scale)), int(math.floor(minWindowSize * scale * ar)))
+    profiler = profiling.activeProfiler
+    sliceTime = 0.0
+    evaluateTime = 0.0
+    accepted = 0
+
+    for cw in candidateWindows:
+        if profiler is not None:
+            start = time.perf_counter()
+
+        windowImage = image[cw.left:(cw.right), cw.top:(cw.bottom)]
+
+        if profiler is not None:
+            sliced = time.perf_counter()
+
+        decision, score = proposalEvaluator.evaluate(windowImage)
+
+        if profiler is not None:
+            sliceTime += sliced - start
+            evaluateTime += time.perf_counter() - sliced
+
+        if decision:
+            accepted += 1
+
+            if maxProposals is not None:
+                scoredProposals.add((cw, score))
+            else:
+                scoredProposals.append((cw, score))
+
+    #Per window timings are accumulated and reported once, to keep the profiler out of the inner loop.
+    #They are left out of the trace, where the per call events of the evaluator already show them
+    if profiler is not None:
+        profiler.addStage("windowSlicing", None, sliceTime, trace = False)
+        profiler.addStage("evaluate", None, evaluateTime, trace = False)
+        profiler.count("windows.evaluated", len(candidateWindows))
+        profiler.count("proposals.accepted", accepted)
+
+    if maxProposals is not None:
+        return scoredProposals.proposals()
+
+    return scoredProposals
+
+"""
+Generator version of generateProposals. Proposals are yielded as soon as each window size
+(a scale and aspect ratio combination) has been scored, as tuples (windowSize, scoredProposals),
+so consumers can start processing before the whole image has been scored at all scales.
+"""
+def iterProposals(image, proposalEvaluator, minWindowSize = 96, maxWindowSize = 96,
+                  scaleFactor = 1.5, aspectRatios = [1.0], stepSize = 8, cascade = None,
+                  maxProposalsPerScale = None, coarseToFine = False):
+    mask = extractPolarMask(image)
+
+    if cascade is not None:
+        cascade.prepare(image)
+
+    for window in proposalWindowSizes(minWindowSize, maxWindowSize, scaleFactor, aspectRatios, coarseToFine):
+        candidateWindows = polarSlidingWindow(image.shape, window, mask, stepSize = stepSize)
+        profiling.count("windows.candidates", len(candidateWindows))
+
+        if cascade is not None:
+            candidateWindows = cascade.filterWindows(candidateWindows)
+
+        yield window, scoreWindows(image, candidateWindows, proposalEvaluator, maxProposalsPerScale)
+
+"""
+Generates (window, score) proposals with a polar sliding window over multiple scales and aspect ratios.
+If a ProposalCascade is given, candidate windows are filtered by it before reaching the proposal evaluator.
+The number of proposals can be bounded with maxProposalsPerScale (for each window size) and maxProposals
+(in total), in which case only the highest scoring ones are kept as they are scored, and proposals are
+returned by decreasing score.
+"""
+def generateProposals(image, proposalEvaluator, minWindowSize = 96, maxWindowSize = 96,
+                      scaleFactor = 1.5, aspectRatios = [1.0], stepSize = 8, doNMS = False, nmsThresh = 0.5,
+                      cascade = None, maxProposals = None, maxProposalsPerScale = None):
+    scoredProposals = []
+
+    scaleLimit = maxProposalsPerScale
+
+    if maxProposals is not None:
+        scoredProposals = TopProposals(maxProposals)
+
+        #No scale can contribute more than maxProposals, so each scale is also scored with a bounded heap
+        scaleLimit = maxProposals if maxProposalsPerScale is None else min(maxProposals, maxProposalsPerScale)
+
+    for window, windowProposals in iterProposals(image, proposalEvaluator, minWindowSize, maxWindowSize, scaleFactor,
+                                                 aspectRatios, stepSize, cascade, scaleLimit):
+        scoredProposals.extend(windowProposals)
+
+    if maxProposals is not None:
+        scoredProposals = scoredProposals.proposals()
+    elif maxProposalsPerScale is not None:
+        scoredProposals.sort(key = lambda proposal: float(np.squeeze(proposal[1])), reverse = True)
 
     if doNMS:
         scoredProposals = nonMaximumSupression(scoredProposals, nmsThresh)
@@ -173,39 +346,97 @@ def denseProposalScores(image, proposalScorer, minWindowSize = 96, maxWindowSize
 
 
 """
-Generates detections through a sliding window.
-For each detection, this method returns a tuple (window, score, class)
+Scores the same windows as denseProposalScores, but writes each score into a 2D float array at the
+window's center, with one cell per stride x stride block of the image. Cells without a window are NaN.
+If poolScales is True, the scores are max-pooled across scales and aspect ratios and a single array is returned,
+else a dictionary indexed by window size (as used by polarSlidingWindow) with one array per scale is returned.
 """
-def generateSlidingWindowDetections(image, classWindowEvaluator, minWindowSize=96, maxWindowSize=96,
-                                    scaleFactor=1.5, aspectRatios=[1.0], stepSize=8, doNMS=False):
+def denseProposalScoreMap(image, proposalScorer, minWindowSize = 96, maxWindowSize = 96,
+                          scaleFactor = 1.5, aspectRatios = [1.0], stride = 8, poolScales = True):
+    mask = extractPolarMask(image)
+    mapShape = ((image.shape[0] + stride - 1) // stride, (image.shape[1] + stride - 1) // stride)
 
+    scoreMaps = {}
+    pooledMap = np.full(mapShape, np.nan, dtype = np.float32)
 
-    mask = extractPolarMask(image)
-    scoredProposals = []
+    for window in proposalWindowSizes(minWindowSize, maxWindowSize, scaleFactor, aspectRatios):
+        candidateWindows = polarSlidingWindow(image.shape, window, mask, stepSize = stride)
+        scoreMap = np.full(mapShape, np.nan, dtype = np.float32)
 
-    for ar in aspectRatios:
-        window = (int(math.floor(minWindowSize)), int(math.floor(minWindowSize * ar)))
-        scale = 1
+        for cw in candidateWindows:
+            windowImage = image[cw.left:(cw.right), cw.top:(cw.bottom)]
+            x, y = cw.center
 
-        while max(window) <= maxWindowSize:
+            scoreMap[x // stride, y // stride] = float(np.squeeze(proposalScorer.score(windowImage)))
 
-            candidateWindows = polarSlidingWindow(image.shape, window, mask, stepSize=stepSize)
+        if poolScales:
+            np.fmax(pooledMap, scoreMap, out = pooledMap)
+        else:
+            scoreMaps[window] = scoreMap
 
-            proposalCount = 0
-            for cw in candidateWindows:
+    if poolScales:
+        return pooledMap
 
-                windowImage = image[cw.left:(cw.right), cw.top:(cw.bottom)]
+    return scoreMaps
 
-                decision, score, classLabel = classWindowEvaluator.evaluate(windowImage)
+"""
+Scores every window of the given shape with top left corner (i * stride, j * stride), by passing stacks of
+up to batchSize windows to scoreBatch (a function taking a (N, rows, cols) array and returning N scores,
+as the scoreBatch methods of the proposal evaluators). Returns a 2D array whose element (i, j) is the score
+of that window, equal (up to rounding) to scoring each window alone.
+"""
+def slidingWindowScores(scoreBatch, image, windowShape, stride = 8, batchSize = 256):
+    outputShape = ((image.shape[0] - windowShape[0]) // stride + 1, (image.shape[1] - windowShape[1]) // stride + 1)
 
-                if decision:
-                    scoredProposals.append((cw, score, classLabel))
-                    proposalCount += 1
+    if outputShape[0] <= 0 or outputShape[1] <= 0:
+        raise ValueError("Image of shape {} is smaller than the window {}".format(image.shape, windowShape))
 
-            # print("{} / (max {}) proposals generated at AR {} scale {} window {}".format(proposalCount, len(candidateWindows), ar, scale, window))
+    #(rows, cols, windowRows, windowCols) view of all windows, sharing memory with the image.
+    #Only the windows of one batch are copied into a contiguous stack at a time
+    windows = np.lib.stride_tricks.sliding_window_view(image, tuple(windowShape))[::stride, ::stride]
+    windowCount = outputShape[0] * outputShape[1]
+    scores = np.empty(windowCount, dtype = np.float32)
 
-            scale *= scaleFactor
-            window = (int(math.floor(minWindowSize * scale)), int(math.floor(minWindowSize * scale * ar)))
+    for start in range(0, windowCount, batchSize):
+        rows, cols = np.unravel_index(np.arange(start, min(start + batchSize, windowCount)), outputShape)
+        batch = windows[rows, cols]
+        scores[start:start + batch.shape[0]] = np.asarray(scoreBatch(batch)).reshape(-1)
+
+    return scores.reshape(outputShape)
+
+"""
+Generator version of generateSlidingWindowDetections. Detections (window, score, class) are yielded
+as soon as each window size has been evaluated, as tuples (windowSize, detections).
+"""
+def iterSlidingWindowDetections(image, classWindowEvaluator, minWindowSize=96, maxWindowSize=96,
+                                scaleFactor=1.5, aspectRatios=[1.0], stepSize=8, coarseToFine=False):
+    mask = extractPolarMask(image)
+
+    for window in proposalWindowSizes(minWindowSize, maxWindowSize, scaleFactor, aspectRatios, coarseToFine):
+        candidateWindows = polarSlidingWindow(image.shape, window, mask, stepSize=stepSize)
+        detections = []
+
+        for cw in candidateWindows:
+            windowImage = image[cw.left:(cw.right), cw.top:(cw.bottom)]
+
+            decision, score, classLabel = classWindowEvaluator.evaluate(windowImage)
+
+            if decision:
+                detections.append((cw, score, classLabel))
+
+        yield window, detections
+
+"""
+Generates detections through a sliding window.
+For each detection, this method returns a tuple (window, score, class)
+"""
+def generateSlidingWindowDetections(image, classWindowEvaluator, minWindowSize=96, maxWindowSize=96,
+                                    scaleFactor=1.5, aspectRatios=[1.0], stepSize=8, doNMS=False):
+    scoredProposals = []
+
+    for window, detections in iterSlidingWindowDetections(image, classWindowEvaluator, minWindowSize, maxWindowSize,
+                                                          scaleFactor, aspectRatios, stepSize):
+        scoredProposals += detections
 
     if doNMS:
         scoredProposals = nonMaximumSupression(scoredProposals)
@@ -293,3 +524,32 @@ def generateObjectnessMapDetectionsMultiThreshold(image, objectnessMap, threshol
             scoredProposals[thresh] = nonMaximumSupression(scoredProposals[thresh], nmsThresh)
 
     return scoredProposals
+
+"""
+Vectorized version of generateObjectnessMapDetections. All window centers are read from the objectness map
+with a single gather, then thresholded and sorted by decreasing objectness.
+Returns a tuple (boxes, scores), where boxes is a (N, 4) integer array of [left, top, right, bottom] coordinates
+and scores is a (N,) array. A precomputed polar mask can be given to skip extractPolarMask.
+"""
+def generateObjectnessMapDetectionsArray(image, objectnessMap, threshold = 0.5, stepSize = 8, windowSize = 96,
+                                         doNMS = False, nmsThresh = 0.5, polarMask = None):
+    if polarMask is None:
+        polarMask = extractPolarMask(image)
+
+    positions = polarSlidingWindowPositions(image.shape, (windowSize, windowSize), polarMask, stepSize = stepSize)
+    centers = positions + windowSize // 2
+
+    objectness = np.asarray(objectnessMap[centers[:, 0], centers[:, 1]])
+
+    selected = np.flatnonzero(objectness >= threshold)
+    selected = selected[np.argsort(-objectness[selected], kind = "stable")]
+
+    boxes = np.concatenate([positions[selected], positions[selected] + windowSize], axis = 1)
+    scores = objectness[selected]
+
+    if doNMS:
+        keep = nonMaximumSupressionArray(boxes, scores, nmsThresh)
+        boxes = boxes[keep]
+        scores = scores[keep]
+
+    return boxes, scores
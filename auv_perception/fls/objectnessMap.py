@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+"""
+Position in a response of length inputLength of each output coordinate, when upsampling it to outputLength samples
+as scipy.ndimage.zoom does (first and last samples of both grids are aligned).
+"""
+def responseCoordinates(coordinates, inputLength, outputLength):
+    if outputLength <= 1:
+        return np.zeros_like(coordinates, dtype = np.float64)
+
+    return coordinates * ((inputLength - 1) / float(outputLength - 1))
+
+"""
+Splits coordinates into the index of the response sample before them and the interpolation weight of the next sample.
+"""
+def interpolationWeights(coordinates, inputLength):
+    lower = np.clip(np.floor(coordinates).astype(np.int64), 0, max(inputLength - 2, 0))
+    weights = coordinates - lower
+
+    if inputLength == 1:
+        weights = np.zeros_like(weights)
+
+    return lower, weights
+
+"""
+Objectness map of an image, stored as the native low resolution FCN response.
+Values are bilinearly interpolated only where they are read, and equal (up to rounding) those of the full resolution map
+from scipy.ndimage.zoom(response, order = 1), so it can replace that map in generateObjectnessMapDetections*
+without allocating or interpolating a whole frame.
+Indexing follows NumPy: objectnessMap[x, y] with integers, integer arrays (broadcast together) or slices.
+toArray() builds the full resolution map, if needed.
+"""
+class ObjectnessMap:
+    def __init__(self, response, imageShape):
+        self.response = np.asarray(response)
+        self.shape = tuple(imageShape)
+        self.ndim = 2
+
+    """
+    Bilinear interpolation of the response at integer image coordinates x and y (arrays, broadcast together).
+    """
+    def sample(self, x, y):
+        rows, cols = self.response.shape
+
+        x0, fx = interpolationWeights(responseCoordinates(np.asarray(x), rows, self.shape[0]), rows)
+        y0, fy = interpolationWeights(responseCoordinates(np.asarray(y), cols, self.shape[1]), cols)
+
+        x1 = np.minimum(x0 + 1, rows - 1)
+        y1 = np.minimum(y0 + 1, cols - 1)
+
+        top = (1.0 - fy) * self.response[x0, y0] + fy * self.response[x0, y1]
+        bottom = (1.0 - fy) * self.response[x1, y0] + fy * self.response[x1, y1]
+
+        return (1.0 - fx) * top + fx * bottom
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple) or len(key) != 2:
+            raise ValueError("ObjectnessMap must be indexed with two coordinates, got {}".format(key))
+
+        x, y = key
+        sliced = isinstance(x, slice) or isinstance(y, slice)
+
+        if isinstance(x, slice):
+            x = np.arange(self.shape[0])[x]
+
+        if isinstance(y, slice):
+            y = np.arange(self.shape[1])[y]
+
+        x = np.asarray(x)
+        y = np.asarray(y)
+
+        #Slices index independent axes, as in NumPy
+        if sliced and x.ndim > 0 and y.ndim > 0:
+            x = x[:, np.newaxis]
+            y = y[np.newaxis, :]
+
+        for coordinates, length in [(x, self.shape[0]), (y, self.shape[1])]:
+            if np.any(coordinates >= length) or np.any(coordinates < -length):
+                raise IndexError("Index out of bounds for ObjectnessMap of shape {}".format(self.shape))
+
+        values = self.sample(np.where(x < 0, x + self.shape[0], x), np.where(y < 0, y + self.shape[1], y))
+
+        return values[()] if values.ndim == 0 else values
+
+    """
+    Full resolution objectness map, as a 2D array.
+    """
+    def toArray(self):
+        from scipy.ndimage import zoom
+
+        zoomFactor = (self.shape[0] / self.response.shape[0], self.shape[1] / self.response.shape[1])
+
+        return zoom(self.response, zoom = zoomFactor, order = 1)
+
+    def __array__(self, dtype = None, copy = None):
+        array = self.toArray()
+
+        return array if dtype is None else array.astype(dtype)
@@ -0,0 +1,186 @@
+from .. import profiling
+
+import numpy as np
+
+"""
+Sums of an image and of its square over arbitrary rectangles, in constant time per rectangle,
+through integral images (summed area tables).
+"""
+class IntegralImages:
+    def __init__(self, image):
+        values = image.astype(np.float64)
+
+        self.shape = image.shape
+        self.sum = np.zeros((image.shape[0] + 1, image.shape[1] + 1))
+        self.squaredSum = np.zeros((image.shape[0] + 1, image.shape[1] + 1))
+
+        self.sum[1:, 1:] = values.cumsum(axis = 0).cumsum(axis = 1)
+        self.squaredSum[1:, 1:] = np.square(values).cumsum(axis = 0).cumsum(axis = 1)
+
+    @staticmethod
+    def rectangleSum(table, left, top, right, bottom):
+        return table[right, bottom] - table[left, bottom] - table[right, top] + table[left, top]
+
+    def windowSums(self, left, top, right, bottom):
+        return IntegralImages.rectangleSum(self.sum, left, top, right, bottom)
+
+    def windowSquaredSums(self, left, top, right, bottom):
+        return IntegralImages.rectangleSum(self.squaredSum, left, top, right, bottom)
+
+"""
+A cascade stage that rejects windows with a statistic of their pixel intensities outside of [minValue, maxValue].
+Supported statistics are mean, variance, energy (mean of squared intensities) and max (maximum intensity).
+Either bound can be None to leave that side unbounded.
+"""
+class WindowStatisticStage:
+    STATISTICS = ["mean", "variance", "energy", "max"]
+
+    def __init__(self, statistic, minValue = None, maxValue = None):
+        if statistic not in WindowStatisticStage.STATISTICS:
+            raise ValueError("Invalid statistic: {}".format(statistic))
+
+        self.statistic = statistic
+        self.minValue = minValue
+        self.maxValue = maxValue
+
+    def __str__(self):
+        bounds = []
+
+        if self.minValue is not None:
+            bounds.append("{} >= {}".format(self.statistic, self.minValue))
+
+        if self.maxValue is not None:
+            bounds.append("{} <= {}".format(self.statistic, self.maxValue))
+
+        if len(bounds) == 0:
+            return self.statistic
+
+        return " and ".join(bounds)
+
+    def accept(self, values):
+        accepted = np.ones(values.shape, dtype = bool)
+
+        if self.minValue is not None:
+            accepted &= values >= self.minValue
+
+        if self.maxValue is not None:
+            accepted &= values <= self.maxValue
+
+        return accepted
+
+"""
+Cheap early-rejection cascade that runs before an expensive ProposalEvaluator.
+Each stage rejects candidate windows based on intensity statistics computed from integral images,
+and only the windows that pass all stages are given to the evaluator.
+
+The number of windows entering and surviving each stage is accumulated across calls, so survival rates
+can be inspected with survivalRates() to tune the stage bounds. Call reset() to clear the counters.
+"""
+class ProposalCascade:
+    def __init__(self, stages):
+        self.stages = stages
+        self.integralImages = None
+        self.image = None
+        self.maxImages = {}
+
+        self.reset()
+
+    def reset(self):
+        self.stageInputs = [0] * len(self.stages)
+        self.stageSurvivors = [0] * len(self.stages)
+
+    """
+    Precomputes the integral images of the given image. Must be called before filtering its windows.
+    """
+    @profiling.profiled("ProposalCascade.prepare")
+    def prepare(self, image):
+        self.image = image
+        self.integralImages = IntegralImages(image)
+        self.maxImages = {}
+
+    #Maximum over all windows of the given size, indexed by the window's top left corner
+    def maxImage(self, windowSize):
+        from scipy.ndimage import maximum_filter1d
+
+        if windowSize not in self.maxImages:
+            maxRows = maximum_filter1d(self.image, windowSize[0], axis = 0, origin = -(windowSize[0] // 2))
+            self.maxImages[windowSize] = maximum_filter1d(maxRows, windowSize[1], axis = 1, origin = -(windowSize[1] // 2))
+
+        return self.maxImages[windowSize]
+
+    def windowStatistic(self, statistic, left, top, right, bottom):
+        area = ((right - left) * (bottom - top)).astype(np.float64)
+
+        if statistic == "max":
+            values = np.zeros(left.shape)
+
+            #Windows are grouped by size, as the maximum image depends on it
+            sizes = np.stack([right - left, bottom - top], axis = 1)
+
+            for size in np.unique(sizes, axis = 0):
+                idx = np.flatnonzero((sizes[:, 0] == size[0]) & (sizes[:, 1] == size[1]))
+                values[idx] = self.maxImage((int(size[0]), int(size[1])))[left[idx], top[idx]]
+
+            return values
+
+        mean = self.integralImages.windowSums(left, top, right, bottom) / area
+
+        if statistic == "mean":
+            return mean
+
+        energy = self.integralImages.windowSquaredSums(left, top, right, bottom) / area
+
+        if statistic == "energy":
+            return energy
+
+        return np.maximum(energy - np.square(mean), 0.0)
+
+    """
+    Returns the candidate windows (list of Rectangle) that pass all stages of the cascade.
+    """
+    @profiling.profiled("ProposalCascade.filterWindows")
+    def filterWindows(self, candidateWindows):
+        if self.integralImages is None:
+            raise ValueError("prepare must be called with an image before filtering windows")
+
+        if len(candidateWindows) == 0 or len(self.stages) == 0:
+            return candidateWindows
+
+        corners = np.array([(cw.left, cw.top, cw.right, cw.bottom) for cw in candidateWindows], dtype = np.int64)
+        survivors = np.arange(len(candidateWindows))
+
+        for i, stage in enumerate(self.stages):
+            self.stageInputs[i] += len(survivors)
+
+            if len(survivors) == 0:
+                continue
+
+            left, top, right, bottom = corners[survivors].T
+            values = self.windowStatistic(stage.statistic, left, top, right, bottom)
+            survivors = survivors[stage.accept(values)]
+
+            self.stageSurvivors[i] += len(survivors)
+
+        return [candidateWindows[i] for i in survivors]
+
+    """
+    Returns a list with a dictionary per stage, containing the stage description, the number of windows
+    that entered and survived the stage, and the survival rate (conditional on reaching the stage).
+    """
+    def survivalRates(self):
+        rates = []
+
+        for stage, inputs, survivors in zip(self.stages, self.stageInputs, self.stageSurvivors):
+            rate = survivors / inputs if inputs > 0 else 1.0
+            rates.append({"stage": str(stage), "windows": inputs, "survivors": survivors, "survivalRate": rate})
+
+        return rates
+
+    """
+    Fraction of all candidate windows that passed the whole cascade, and so were given to the expensive evaluator.
+    """
+    def overallSurvivalRate(self):
+        if len(self.stages) == 0 or self.stageInputs[0] == 0:
+            return 1.0
+
+        return self.stageSurvivors[-1] / self.stageInputs[0]
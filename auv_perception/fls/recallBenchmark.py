@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from ..annotation.evaluation import DetectionEvaluator
+from ..annotation.rectangle import Rectangle
+
+#Frames are described by plain dictionaries, so they can be sent to worker processes:
+#{"id": unique name, "source": "file" or "hdf5", "path": image or hdf5 file, "index": image index in the hdf5 file,
+# "groundTruth": list of [left, top, right, bottom] boxes}
+
+def rectangleBox(rectangle):
+    return [rectangle.left, rectangle.top, rectangle.right, rectangle.bottom]
+
+"""
+Frames of a dataset labeled in XML (see readXML). Image paths are relative to imageDirectory,
+which defaults to the directory of the XML file. Labels are converted with Rectangle.fromQRectF.
+"""
+def xmlDatasetFrames(xmlFileName, imageDirectory = None):
+    from ..annotation.labelsIO import readXML
+
+    if imageDirectory is None:
+        imageDirectory = os.path.dirname(os.path.abspath(xmlFileName))
+
+    frames = []
+
+    for labeledImage in readXML(xmlFileName):
+        groundTruth = [rectangleBox(Rectangle.fromQRectF(label.rectangle)) for label in labeledImage.labels]
+
+        frames.append({"id": labeledImage.fileName, "source": "file", "path": os.path.join(imageDirectory, labeledImage.fileName),
+                       "index": None, "groundTruth": groundTruth})
+
+    return frames
+
+"""
+Frames of a dataset stored in a HDF5LabelsFile. Labels are converted to the same Rectangles as Rectangle.fromQRectF
+gives for the equivalent XML labels.
+"""
+def hdf5DatasetFrames(hdf5FileName):
+    import h5py
+
+    frames = []
+
+    with h5py.File(hdf5FileName, "r") as f:
+        labels = f["labeledImages/labels"]
+
+        for index in range(labels.shape[0]):
+            originalFileName, labeledRectangles = labels[index]
+            groundTruth = []
+
+            for classLabel, topLeftX, topLeftY, width, height in labeledRectangles:
+                groundTruth.append(rectangleBox(Rectangle((int(topLeftY), int(topLeftX)), int(width), int(height))))
+
+            frames.append({"id": "{}:{}".format(hdf5FileName, index), "source": "hdf5", "path": hdf5FileName,
+                           "index": index, "groundTruth": groundTruth})
+
+    return frames
+
+#Per process state of the workers: the evaluator, the open hdf5 files and the benchmark configuration
+workerState = {}
+
+"""
+Builds the proposal evaluator described by config in a worker process, once. config is a dictionary with
+"evaluator" (the name of a class in auv_perception.fls), "evaluatorArguments" (keyword arguments of its constructor),
+"proposalArguments" (keyword arguments of generateProposals, or of multiScaleDetections for a FCNProposalScorer),
+"iouThresholds", "matching" and "imageScale" (factor applied to the images before scoring).
+"""
+def initializeWorker(config):
+    from .. import fls
+
+    evaluatorClass = getattr(fls, config["evaluator"])
+
+    workerState["config"] = config
+    workerState["evaluator"] = evaluatorClass(**config.get("evaluatorArguments", {}))
+    workerState["hdf5Files"] = {}
+
+def loadFrameImage(frame):
+    if frame["source"] == "hdf5":
+        import h5py
+
+        files = workerState.setdefault("hdf5Files", {})
+
+        if frame["path"] not in files:
+            files[frame["path"]] = h5py.File(frame["path"], "r")
+
+        return np.array(files[frame["path"]]["labeledImages/images"][frame["index"]])
+
+    from imageio import imread
+
+    return np.asarray(imread(frame["path"], pilmode = "L"))
+
+"""
+Proposal boxes and scores of one image, with the evaluator of the worker.
+"""
+def frameProposals(image):
+    from .objectProposals import generateProposals
+
+    config = workerState["config"]
+    evaluator = workerState["evaluator"]
+    proposalArguments = config.get("proposalArguments", {})
+
+    if hasattr(evaluator, "multiScaleDetections"):
+        return evaluator.multiScaleDetections(image, **proposalArguments)
+
+    proposals = generateProposals(image, evaluator, **proposalArguments)
+    boxes = np.array([rectangleBox(window) for window, score in proposals], dtype = np.int64).reshape((-1, 4))
+    scores = np.array([float(np.squeeze(score)) for window, score in proposals])
+
+    return boxes, scores
+
+"""
+Evaluates a chunk of frames in a worker, returning a record with the frame ids, the state of a DetectionEvaluator
+over them and the time spent.
+"""
+def evaluateFrameChunk(frames):
+    config = workerState["config"]
+    evaluator = DetectionEvaluator(config.get("iouThresholds", [0.5]), config.get("matching", "greedy"))
+    start = time.perf_counter()
+
+    for frame in frames:
+        image = loadFrameImage(frame).astype(np.float32) * config.get("imageScale", 1.0)
+        boxes, scores = frameProposals(image)
+
+        evaluator.addFrame(boxes, scores, np.array(frame["groundTruth"], dtype = np.int64).reshape((-1, 4)))
+
+    return {"frames": [frame["id"] for frame in frames], "evaluator": evaluator.toDict(), "seconds": time.perf_counter() - start}
+
+"""
+Reads the records of a previous run from a JSON lines results file, returning the merged DetectionEvaluator
+(None if there are no records) and the set of ids of the frames already evaluated.
+"""
+def readResults(resultsFile):
+    merged = None
+    done = set()
+
+    if resultsFile is None or not os.path.exists(resultsFile):
+        return merged, done
+
+    with open(resultsFile, "rt") as f:
+        for line in f:
+            line = line.strip()
+
+            #A truncated last line is left by an interrupted run, its frames are evaluated again
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            evaluator = DetectionEvaluator.fromDict(record["evaluator"])
+            merged = evaluator if merged is None else merged.merge(evaluator)
+            done.update(record["frames"])
+
+    return merged, done
+
+"""
+Evaluates proposals on a labeled dataset (a list of frames, see xmlDatasetFrames and hdf5DatasetFrames) over a pool
+of processes, each with its own evaluator built from config (see initializeWorker).
+Frames are sent to workers in chunks of chunkSize, and each finished chunk is appended to resultsFile (JSON lines),
+so an interrupted run continues where it stopped when started again with the same resultsFile.
+Progress is written to stderr. Returns the DetectionEvaluator with the results of all frames.
+"""
+def runRecallBenchmark(frames, config, resultsFile = None, processes = None, chunkSize = 32, progress = True):
+    merged, done = readResults(resultsFile)
+
+    if merged is None:
+        merged = DetectionEvaluator(config.get("iouThresholds", [0.5]), config.get("matching", "greedy"))
+
+    pending = [frame for frame in frames if frame["id"] not in done]
+    chunks = [pending[i:i + chunkSize] for i in range(0, len(pending), chunkSize)]
+
+    if progress and len(done) > 0:
+        print("Resuming: {} frames already evaluated, {} left".format(len(frames) - len(pending), len(pending)), file = sys.stderr)
+
+    if len(chunks) == 0:
+        return merged
+
+    resultsOutput = open(resultsFile, "at") if resultsFile is not None else None
+    start = time.perf_counter()
+    finished = 0
+
+    try:
+        with multiprocessing.Pool(processes, initializer = initializeWorker, initargs = (config,)) as pool:
+            for record in pool.imap_unordered(evaluateFrameChunk, chunks):
+                merged.merge(DetectionEvaluator.fromDict(record["evaluator"]))
+                finished += len(record["frames"])
+
+                if resultsOutput is not None:
+                    resultsOutput.write(json.dumps(record) + "\n")
+                    resultsOutput.flush()
+
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    remaining = elapsed / finished * (len(pending) - finished)
+
+                    print("{}/{} frames, {:.1f} frames/s, {:.0f} s left".format(finished, len(pending), finished / elapsed, remaining),
+                          file = sys.stderr)
+    finally:
+        if resultsOutput is not None:
+            resultsOutput.close()
+
+    return merged
+
+"""
+Main results of a proposal recall benchmark: recall (fraction of ground truth covered by a proposal) at each
+IoU threshold, mean best IoU and proposals per frame, plus the full summary of the DetectionEvaluator.
+Recall and mean best IoU use the definitions of computeRecall (see DetectionEvaluator), so they are comparable with
+earlier studies, while precision and average precision in the summary use the usual IoU. The "iouDefinitions" entry
+names the IoU of each field.
+"""
+def recallReport(evaluator):
+    summary = evaluator.summary()
+
+    return {"recall": {str(t): evaluator.proposalRecall(t) for t in evaluator.iouThresholds},
+            "meanBestIoU": evaluator.meanBestIoU(), "proposalsPerFrame": summary["detectionsPerFrame"],
+            "frames": evaluator.frameCount, "iouDefinitions": {"recall": "enclosing", "meanBestIoU": "enclosing"},
+            "summary": summary}
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+
+import numpy as np
+
+"""
+A model shared between evaluators. Calls to predict are serialized with a lock, as Keras models
+are not safe to use from several threads at once. Any other attribute is forwarded to the wrapped model.
+"""
+class SharedModel:
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+
+    def predict(self, x, batch_size = 32):
+        with self.lock:
+            return self.model.predict(x, batch_size = batch_size)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+"""
+Process-wide cache of loaded models, so building the graph, reading the hdf5 weights and compiling
+happen once per model instead of once per evaluator construction.
+
+Models are cached by (architecture, absolute weights path, modification times of the weights file and of any extra
+files the model is built from, like a JSON architecture), so updated files are reloaded, and the model loaded from
+their previous version is evicted. Each model is warmed up with a dummy batch after loading, to pay the setup latency of the
+first predict at load time, and is handed out as a SharedModel. Loading is thread-safe, and concurrent requests
+for the same model load it only once.
+"""
+class ModelRegistry:
+    def __init__(self):
+        self.models = {}
+        self.loadLocks = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def modelKey(architecture, weightsFile, extraFiles = ()):
+        files = [weightsFile] + list(extraFiles)
+        version = tuple((os.path.abspath(f), os.path.getmtime(f)) for f in files)
+
+        return (architecture, os.path.abspath(weightsFile), version)
+
+    #Removes the cached models with the same architecture and weights path as key but other file versions
+    def evictOlderVersions(self, key):
+        for cachedKey in list(self.models.keys()):
+            if cachedKey[:2] == key[:2] and cachedKey != key:
+                del self.models[cachedKey]
+
+    """
+    Returns the shared model for the given architecture and weights file, calling loader() to build it
+    if it is not cached yet. The model is warmed up with a zero batch of warmupShape, or of its own input shape
+    (with unknown dimensions set to 96) if warmupShape is None. Use warmup = False to skip it.
+    extraFiles are other files the loader reads, whose changes also reload the model.
+    """
+    def load(self, architecture, weightsFile, loader, warmupShape = None, warmup = True, extraFiles = ()):
+        key = ModelRegistry.modelKey(architecture, weightsFile, extraFiles)
+
+        with self.lock:
+            if key in self.models:
+                return self.models[key]
+
+            keyLock = self.loadLocks.setdefault(key, threading.Lock())
+
+        with keyLock:
+            #Another thread may have loaded it while we waited
+            with self.lock:
+                if key in self.models:
+                    return self.models[key]
+
+            model = loader()
+
+            if warmup:
+                ModelRegistry.warmup(model, warmupShape)
+
+            sharedModel = SharedModel(model)
+
+            with self.lock:
+                self.evictOlderVersions(key)
+                self.models[key] = sharedModel
+                self.loadLocks.pop(key, None)
+
+        return sharedModel
+
+    @staticmethod
+    def warmup(model, warmupShape = None):
+        if warmupShape is None:
+            if not hasattr(model, "input_shape"):
+                return
+
+            warmupShape = tuple(1 if i == 0 else (96 if d is None else d) for i, d in enumerate(model.input_shape))
+
+        model.predict(np.zeros(warmupShape, dtype = np.float32), batch_size = warmupShape[0])
+
+    def isLoaded(self, architecture, weightsFile, extraFiles = ()):
+        with self.lock:
+            return ModelRegistry.modelKey(architecture, weightsFile, extraFiles) in self.models
+
+    def clear(self):
+        with self.lock:
+            self.models = {}
+            self.loadLocks = {}
+
+#Default registry shared by all evaluators in the process
+modelRegistry = ModelRegistry()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+import time
+
+import numpy as np
+
+from .proposalCascade import IntegralImages
+
+"""
+Normalized cross-correlation of every template with every window of an image, in one go.
+Templates is a (T, rows, cols) array. Correlations are computed with the FFT, reusing the image transform
+for all templates, and the window means and norms come from integral images.
+Returns an array with shape (H - rows + 1, W - cols + 1) whose element (x, y) is the maximum over templates
+of the NCC of the window with top left corner (x, y), clipped to [0, 1] as TMProposalEvaluator does.
+Windows with (near) constant intensity have an undefined NCC and get a score of zero.
+"""
+def maxNormalizedCrossCorrelationMap(image, templates):
+    image = np.asarray(image, dtype = np.float64)
+    templates = np.asarray(templates, dtype = np.float64)
+
+    count, rows, cols = templates.shape
+    outputShape = (image.shape[0] - rows + 1, image.shape[1] - cols + 1)
+
+    if outputShape[0] <= 0 or outputShape[1] <= 0:
+        raise ValueError("Templates of size {}x{} do not fit in an image of shape {}".format(rows, cols, image.shape))
+
+    #Sum of squared deviations from the mean for every window
+    integralImages = IntegralImages(image)
+    x = np.arange(outputShape[0])[:, np.newaxis]
+    y = np.arange(outputShape[1])[np.newaxis, :]
+
+    windowSums = integralImages.windowSums(x, y, x + rows, y + cols)
+    windowSquaredSums = integralImages.windowSquaredSums(x, y, x + rows, y + cols)
+    windowDeviations = np.maximum(windowSquaredSums - np.square(windowSums) / (rows * cols), 0.0)
+    windowNorms = np.sqrt(windowDeviations)
+
+    #Circular correlation with an FFT of the image size is exact for all valid positions
+    imageTransform = np.fft.rfft2(image)
+    bestScores = np.full(outputShape, -np.inf)
+
+    for template in templates:
+        centered = template - np.mean(template)
+        templateNorm = np.sqrt(np.sum(np.square(centered)))
+
+        if templateNorm == 0.0:
+            continue
+
+        #Correlating with the zero mean template already removes the window mean
+        kernelTransform = np.fft.rfft2(centered[::-1, ::-1], s = image.shape)
+        correlation = np.fft.irfft2(imageTransform * kernelTransform, s = image.shape)
+        correlation = correlation[rows - 1:, cols - 1:]
+
+        np.maximum(bestScores, correlation / templateNorm, out = bestScores)
+
+    #Relative tolerance, below it the window is considered constant
+    constant = windowDeviations <= 1e-10 * np.maximum(windowSquaredSums, 1.0)
+    scores = np.where(constant, 0.0, bestScores / np.where(constant, 1.0, windowNorms))
+
+    return np.clip(scores, 0.0, 1.0)
+
+#Largest score matrix (windows x templates) built at once, template banks are processed in chunks to respect it
+MAX_SCORE_MATRIX_BYTES = 64 * 1024 * 1024
+
+def templateChunkSize(windowCount):
+    return max(1, MAX_SCORE_MATRIX_BYTES // (8 * max(windowCount, 1)))
+
+"""
+Flattens a (T, rows, cols) template bank into a (T, rows * cols) matrix of zero mean, unit norm rows,
+so the NCC of a normalized window with every template is a single dot product.
+Constant templates get a zero row, so they never match.
+"""
+def normalizedTemplateMatrix(templates):
+    matrix = np.asarray(templates, dtype = np.float64).reshape((len(templates), -1))
+    matrix = matrix - np.mean(matrix, axis = 1, keepdims = True)
+    norms = np.sqrt(np.sum(np.square(matrix), axis = 1, keepdims = True))
+
+    return matrix / np.where(norms > 0.0, norms, 1.0)
+
+def normalizedWindowMatrix(windows):
+    windows = np.asarray(windows, dtype = np.float64).reshape((len(windows), -1))
+    windows = windows - np.mean(windows, axis = 1, keepdims = True)
+    norms = np.sqrt(np.sum(np.square(windows), axis = 1, keepdims = True))
+
+    return windows / np.where(norms > 0.0, norms, 1.0), norms[:, 0] > 0.0
+
+"""
+Maximum over templates of the NCC of each window in a (N, rows, cols) batch, clipped to [0, 1],
+with templateMatrix built by normalizedTemplateMatrix. Constant windows get a score of zero.
+"""
+def maxNormalizedCrossCorrelationBatch(windows, templateMatrix):
+    windows, valid = normalizedWindowMatrix(windows)
+
+    bestScores = np.full(len(windows), -np.inf)
+    chunkSize = templateChunkSize(len(windows))
+
+    for start in range(0, len(templateMatrix), chunkSize):
+        scores = np.dot(windows, templateMatrix[start:start + chunkSize].T)
+        np.maximum(bestScores, np.max(scores, axis = 1), out = bestScores)
+
+    return np.clip(np.where(valid, bestScores, 0.0), 0.0, 1.0)
+
+"""
+Flattens a (T, rows, cols) template bank into a (T, rows * cols) float matrix and the squared norm of each row,
+the template terms of minNormalizedSquareDifferenceBatch, so they are computed once per bank.
+"""
+def squareDifferenceTemplateMatrix(templates):
+    matrix = np.asarray(templates, dtype = np.float64).reshape((len(templates), -1))
+
+    return matrix, np.sum(np.square(matrix), axis = 1)
+
+"""
+Smallest mean squared difference between each window in a (N, rows, cols) batch and the templates,
+divided by the sum of the mean squared differences over all templates, as TMProposalEvaluator.bestSquareDiffMatch.
+templateMatrix and templateEnergies are built by squareDifferenceTemplateMatrix.
+Squared differences are expanded as |w|^2 - 2 w.t + |t|^2 so the cross terms are a matrix product,
+and the running minimum and sum are kept across template chunks.
+"""
+def minNormalizedSquareDifferenceBatch(windows, templateMatrix, templateEnergies):
+    windows = np.asarray(windows, dtype = np.float64).reshape((len(windows), -1))
+    pixels = windows.shape[1]
+
+    windowEnergies = np.sum(np.square(windows), axis = 1, keepdims = True)
+
+    minimum = np.full(len(windows), np.inf)
+    total = np.zeros(len(windows))
+    chunkSize = templateChunkSize(len(windows))
+
+    for start in range(0, len(templateMatrix), chunkSize):
+        chunk = templateMatrix[start:start + chunkSize]
+        differences = windowEnergies - 2.0 * np.dot(windows, chunk.T) + templateEnergies[start:start + chunkSize]
+        differences = np.maximum(differences, 0.0) / pixels
+
+        np.minimum(minimum, np.min(differences, axis = 1), out = minimum)
+        total += np.sum(differences, axis = 1)
+
+    return minimum / total
+
+"""
+Plain Lloyd's k-means, returning the centroids and the cluster of each point.
+Clusters that end up empty are restarted on a random point.
+"""
+def kMeans(points, clusterCount, iterations = 20, seed = 0):
+    random = np.random.RandomState(seed)
+    centroids = points[random.choice(len(points), clusterCount, replace = False)].copy()
+    assignments = np.zeros(len(points), dtype = np.int64)
+
+    for i in range(iterations):
+        distances = np.sum(np.square(centroids), axis = 1) - 2.0 * np.dot(points, centroids.T)
+        newAssignments = np.argmin(distances, axis = 1)
+
+        if i > 0 and np.array_equal(newAssignments, assignments):
+            break
+
+        assignments = newAssignments
+
+        for c in range(clusterCount):
+            members = points[assignments == c]
+            centroids[c] = np.mean(members, axis = 0) if len(members) > 0 else points[random.randint(len(points))]
+
+    return centroids, assignments
+
+"""
+Index over a large template bank, to find the best NCC match of a window without comparing it to every template.
+Normalized templates are projected on their first principal components, so the NCC of a window with a template
+is approximated by a dot product of low dimension.
+Without clusters, the shortlistSize templates with the best approximate scores are scored exactly.
+With clusters, the projected templates are grouped with k-means (as an inverted file index), and the templates of
+the probes clusters whose centroids score best are scored exactly, with one matrix product per cluster.
+Returned scores are always true NCC values; the only error is missing the best template when it is not searched.
+"""
+class TemplateIndex:
+    def __init__(self, templates, components = 32, clusters = None, probes = 4, shortlistSize = 16, seed = 0):
+        self.templateMatrix = normalizedTemplateMatrix(templates)
+        self.probes = probes
+        self.shortlistSize = shortlistSize
+
+        components = min(components, self.templateMatrix.shape[0], self.templateMatrix.shape[1])
+
+        #Principal components of the normalized templates
+        self.mean = np.mean(self.templateMatrix, axis = 0)
+        u, s, vt = np.linalg.svd(self.templateMatrix - self.mean, full_matrices = False)
+        self.projection = vt[:components].T
+        self.projectedTemplates = np.dot(self.templateMatrix - self.mean, self.projection)
+
+        self.centroids = None
+        self.clusterMembers = None
+
+        if clusters is not None:
+            clusters = min(clusters, len(self.projectedTemplates))
+            self.centroids, assignments = kMeans(self.projectedTemplates, clusters, seed = seed)
+            self.clusterMembers = [np.nonzero(assignments == c)[0] for c in range(clusters)]
+
+    """
+    Indices of the shortlistSize templates with the best approximate NCC with each normalized window, as a (N, shortlistSize) array.
+    """
+    def shortlist(self, windowMatrix):
+        projectedWindows = np.dot(windowMatrix, self.projection)
+        approximateScores = np.dot(windowMatrix, self.mean)[:, np.newaxis] + np.dot(projectedWindows, self.projectedTemplates.T)
+
+        if approximateScores.shape[1] <= self.shortlistSize:
+            return np.broadcast_to(np.arange(approximateScores.shape[1]), approximateScores.shape)
+
+        return np.argpartition(-approximateScores, self.shortlistSize - 1, axis = 1)[:, :self.shortlistSize]
+
+    def searchShortlist(self, windowMatrix):
+        candidates = self.shortlist(windowMatrix)
+        scores = np.empty(len(windowMatrix))
+
+        #Shortlisted templates are gathered in chunks of windows to bound memory
+        chunkSize = max(1, MAX_SCORE_MATRIX_BYTES // (8 * windowMatrix.shape[1] * candidates.shape[1]))
+
+        for start in range(0, len(windowMatrix), chunkSize):
+            gathered = self.templateMatrix[candidates[start:start + chunkSize]]
+            chunkScores = np.einsum("nd,nsd->ns", windowMatrix[start:start + chunkSize], gathered)
+            scores[start:start + chunkSize] = np.max(chunkScores, axis = 1)
+
+        return scores
+
+    def searchClusters(self, windowMatrix):
+        probes = min(self.probes, len(self.centroids))
+
+        #For unit norm rows the best NCC is the nearest template, so the nearest centroids are probed
+        projectedWindows = np.dot(windowMatrix - self.mean, self.projection)
+        distances = np.sum(np.square(self.centroids), axis = 1) - 2.0 * np.dot(projectedWindows, self.centroids.T)
+        probed = np.argpartition(distances, probes - 1, axis = 1)[:, :probes]
+
+        scores = np.full(len(windowMatrix), -np.inf)
+
+        for c, members in enumerate(self.clusterMembers):
+            rows = np.nonzero(np.any(probed == c, axis = 1))[0]
+
+            if len(rows) == 0 or len(members) == 0:
+                continue
+
+            clusterScores = np.dot(windowMatrix[rows], self.templateMatrix[members].T)
+            scores[rows] = np.maximum(scores[rows], np.max(clusterScores, axis = 1))
+
+        return scores
+
+    """
+    Maximum NCC over the searched templates of each window in a (N, rows, cols) batch, clipped to [0, 1].
+    Same scores as maxNormalizedCrossCorrelationBatch whenever the best template is searched.
+    """
+    def scoreBatch(self, windows):
+        windowMatrix, valid = normalizedWindowMatrix(windows)
+
+        if self.centroids is None:
+            scores = self.searchShortlist(windowMatrix)
+        else:
+            scores = self.searchClusters(windowMatrix)
+
+        return np.clip(np.where(valid, scores, 0.0), 0.0, 1.0)
+
+"""
+Measures the recall and speed of a TemplateIndex against exhaustive matching, for several search settings.
+settings is a list of (probes, shortlistSize) pairs (probes is only used with clusters, shortlistSize only without).
+Returns a list with a dictionary per setting, with the fraction of windows whose best score is found (recall),
+the maximum and mean score error, the best time over a few repetitions and the speedup over exhaustive matching.
+"""
+def compareTemplateIndex(index, windows, settings, repetitions = 3):
+    def bestTime(function):
+        best = float("inf")
+
+        for i in range(repetitions):
+            start = time.perf_counter()
+            output = function(windows)
+            best = min(best, time.perf_counter() - start)
+
+        return best, output
+
+    exactSeconds, exactScores = bestTime(lambda w: maxNormalizedCrossCorrelationBatch(w, index.templateMatrix))
+    originalSettings = (index.probes, index.shortlistSize)
+    reports = []
+
+    for probes, shortlistSize in settings:
+        index.probes, index.shortlistSize = probes, shortlistSize
+        seconds, scores = bestTime(index.scoreBatch)
+        error = np.abs(exactScores - scores)
+
+        reports.append({"probes": probes, "shortlistSize": shortlistSize,
+                        "recall": float(np.mean(error <= 1e-9)),
+                        "maxAbsError": float(np.max(error)), "meanAbsError": float(np.mean(error)),
+                        "seconds": seconds, "exactSeconds": exactSeconds, "speedup": exactSeconds / seconds})
+
+    index.probes, index.shortlistSize = originalSettings
+
+    return reports
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import math
+
+import numpy as np
+
+#Layers that work pixel by pixel, so they do not change the geometry of a network
+POINTWISE_LAYERS = ["InputLayer", "Activation", "BatchNormalization", "Dropout"]
+
+def layerPair(value):
+    if isinstance(value, (tuple, list)):
+        return int(value[0]), int(value[1])
+
+    return int(value), int(value)
+
+"""
+Geometry of a fully convolutional Keras model with valid convolutions and pooling (channels first).
+Returns (stride, receptiveField, channelDensity) for each image axis: output (i, j) depends on the input pixels
+[i * stride, i * stride + receptiveField) along the first axis (and likewise for the second),
+and channelDensity is the largest number of activations per input pixel in any layer, used to estimate memory.
+Raises a ValueError for layers that make this mapping inexact ('same' padding, dense layers).
+"""
+def networkGeometry(model):
+    stride = [1, 1]
+    receptiveField = [1, 1]
+    channelDensity = 1.0
+    channels = model.input_shape[1] if model.input_shape[1] is not None else 1
+
+    for layer in model.layers:
+        layerType = type(layer).__name__
+        config = layer.get_config()
+
+        if layerType in POINTWISE_LAYERS:
+            continue
+
+        padding = config.get("padding", config.get("border_mode", "valid"))
+
+        if padding != "valid":
+            raise ValueError("Layer {} uses {} padding, only valid padding can be tiled exactly".format(layer.name, padding))
+
+        if layerType in ["Convolution2D", "Conv2D"]:
+            if "kernel_size" in config:
+                kernel = layerPair(config["kernel_size"])
+            else:
+                kernel = (config["nb_row"], config["nb_col"])
+
+            layerStride = layerPair(config.get("strides", config.get("subsample", 1)))
+            channels = config.get("filters", config.get("nb_filter"))
+
+        elif layerType == "MaxPooling2D":
+            kernel = layerPair(config["pool_size"])
+            layerStride = layerPair(config["strides"] if config.get("strides") is not None else kernel)
+
+        else:
+            raise ValueError("Layer {} of type {} is not supported for tiled inference".format(layer.name, layerType))
+
+        for axis in range(2):
+            receptiveField[axis] += (kernel[axis] - 1) * stride[axis]
+            stride[axis] *= layerStride[axis]
+
+        channelDensity = max(channelDensity, channels / float(stride[0] * stride[1]))
+
+    return tuple(stride), tuple(receptiveField), channelDensity
+
+"""
+Number of outputs along an axis of the given input length, for a network with the given stride and receptive field.
+"""
+def outputLength(inputLength, stride, receptiveField):
+    return max(0, (inputLength - receptiveField) // stride + 1)
+
+"""
+Estimated peak activation bytes for one input of the given shape. Activations are float32, and twice the densest
+layer is counted, for its input and output.
+"""
+def activationBytes(inputShape, channelDensity):
+    return 2.0 * 4.0 * channelDensity * inputShape[0] * inputShape[1]
+
+"""
+Largest square tile side (in input pixels) whose activations fit in memoryBudget bytes, for a network with
+the given geometry (see activationBytes).
+The tile is always at least one receptive field, so it produces at least one output.
+"""
+def tileSizeForBudget(memoryBudget, stride, receptiveField, channelDensity):
+    side = int(math.sqrt(memoryBudget / activationBytes((1, 1), channelDensity)))
+
+    return max(side, max(receptiveField) + max(stride))
+
+"""
+Number of images of the given shape that can go through the network together within memoryBudget bytes
+of activations, at least one.
+"""
+def batchSizeForBudget(memoryBudget, imageShape, channelDensity):
+    return max(1, int(memoryBudget // activationBytes(imageShape, channelDensity)))
+
+"""
+Runs a fully convolutional model over an image in square tiles of at most tileSize input pixels per side,
+and stitches the responses into the same 2D array as model.predict on the whole image.
+Consecutive tiles overlap by receptiveField - stride pixels and start on multiples of the stride, so each output
+is computed from exactly the same input pixels as in whole-image inference, and there are no seams.
+Peak memory is bounded by the tile size instead of the image size.
+"""
+def tiledPredict(model, image, stride, receptiveField, tileSize):
+    outputShape = [outputLength(image.shape[axis], stride[axis], receptiveField[axis]) for axis in range(2)]
+
+    if outputShape[0] == 0 or outputShape[1] == 0:
+        raise ValueError("Image of shape {} is smaller than the receptive field {}".format(image.shape, receptiveField))
+
+    #Outputs computed by each tile, along each axis
+    tileOutputs = [outputLength(tileSize, stride[axis], receptiveField[axis]) for axis in range(2)]
+
+    if tileOutputs[0] == 0 or tileOutputs[1] == 0:
+        raise ValueError("Tile size {} is smaller than the receptive field {}".format(tileSize, receptiveField))
+
+    response = np.empty(outputShape, dtype = np.float32)
+
+    for i in range(0, outputShape[0], tileOutputs[0]):
+        rows = min(tileOutputs[0], outputShape[0] - i)
+        top = i * stride[0]
+        bottom = top + (rows - 1) * stride[0] + receptiveField[0]
+
+        for j in range(0, outputShape[1], tileOutputs[1]):
+            cols = min(tileOutputs[1], outputShape[1] - j)
+            left = j * stride[1]
+            right = left + (cols - 1) * stride[1] + receptiveField[1]
+
+            tile = image[top:bottom, left:right]
+            tileResponse = model.predict(tile.reshape((1, 1) + tile.shape), batch_size = 1)[0, 0]
+
+            response[i:i + rows, j:j + cols] = tileResponse
+
+    return response
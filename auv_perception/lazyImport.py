@@ -0,0 +1,30 @@
+import importlib
+
+"""
+Creates the module level __getattr__ and __dir__ functions (PEP 562) of a package, so each public name
+is imported from its submodule on first use, instead of when the package itself is imported.
+This keeps heavy optional dependencies (Keras, PyQt5, matplotlib) out of code paths that do not need them.
+
+attributeModules maps each public name to the relative name of the submodule that defines it.
+A name that maps to its own submodule (like "fls": ".fls") resolves to the submodule itself.
+"""
+def lazyAttributes(packageName, packageGlobals, attributeModules):
+    def __getattr__(name):
+        if name not in attributeModules:
+            raise AttributeError("module {!r} has no attribute {!r}".format(packageName, name))
+
+        module = importlib.import_module(attributeModules[name], packageName)
+
+        if attributeModules[name] == "." + name:
+            value = module
+        else:
+            value = getattr(module, name)
+
+        packageGlobals[name] = value
+
+        return value
+
+    def __dir__():
+        return sorted(set(packageGlobals.keys()) | set(attributeModules.keys()))
+
+    return __getattr__, __dir__
@@ -0,0 +1,189 @@
+from __future__ import division, print_function
+
+import functools
+import json
+import threading
+import time
+
+"""
+Low overhead instrumentation for the perception pipeline.
+Instrumented code wraps its stages in "with profiling.stage(name):", or decorates whole functions
+with @profiling.profiled(name), and reports counts with profiling.count(name, n).
+While no profiler is active all of them are no-ops, so instrumentation can stay in production code.
+Activate a profiler with enableProfiling(), or by using it as a context manager:
+
+    with Profiler() as profiler:
+        generateProposals(image, evaluator)
+
+    print(profiler.toJSON())
+"""
+
+activeProfiler = None
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+NULL_STAGE = NullStage()
+
+class ProfiledStage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.profiler.addStage(self.name, self.start, time.perf_counter() - self.start)
+
+        return False
+
+"""
+Accumulates per-stage timings (number of calls, total, mean and maximum time) and named counters.
+If recordTrace is True, each stage execution is also kept as a trace event (up to maxTraceEvents),
+for export in the Chrome trace format (chrome://tracing or Perfetto).
+"""
+class Profiler:
+    def __init__(self, recordTrace = True, maxTraceEvents = 100000):
+        self.recordTrace = recordTrace
+        self.maxTraceEvents = maxTraceEvents
+        self.lock = threading.Lock()
+
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.origin = time.perf_counter()
+            self.stages = {}
+            self.counters = {}
+            self.traceEvents = []
+
+    def __enter__(self):
+        enableProfiling(self)
+
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        disableProfiling()
+
+        return False
+
+    """
+    Records one execution of a stage. With trace set to False only the timing statistics are updated, for
+    durations accumulated over many interleaved calls, which have no single start time to show in a trace.
+    """
+    def addStage(self, name, start, duration, trace = True):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = [0, 0.0, 0.0]
+
+            stats = self.stages[name]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+
+            if trace and self.recordTrace and len(self.traceEvents) < self.maxTraceEvents:
+                self.traceEvents.append((name, start - self.origin, duration, threading.get_ident()))
+
+    def count(self, name, n = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def toDict(self):
+        with self.lock:
+            stages = {}
+
+            for name, (calls, total, maximum) in self.stages.items():
+                stages[name] = {"calls": calls, "totalSeconds": total, "meanSeconds": total / calls, "maxSeconds": maximum}
+
+            return {"stages": stages, "counters": dict(self.counters)}
+
+    def toJSON(self, fileName = None):
+        jsonString = json.dumps(self.toDict(), indent = 2, sort_keys = True)
+
+        if fileName is not None:
+            with open(fileName, "wt") as jsonFile:
+                jsonFile.write(jsonString)
+
+        return jsonString
+
+    """
+    Returns the recorded stages as a Chrome trace (a dictionary with complete "X" events, in microseconds),
+    optionally writing it as JSON to fileName. Counters are added as metadata.
+    """
+    def toChromeTrace(self, fileName = None):
+        with self.lock:
+            events = []
+
+            for name, start, duration, threadId in self.traceEvents:
+                events.append({"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6,
+                               "pid": 0, "tid": threadId})
+
+            trace = {"traceEvents": events, "displayTimeUnit": "ms", "otherData": dict(self.counters)}
+
+        if fileName is not None:
+            with open(fileName, "wt") as traceFile:
+                json.dump(trace, traceFile)
+
+        return trace
+
+def enableProfiling(profiler = None):
+    global activeProfiler
+
+    if profiler is None:
+        profiler = Profiler()
+
+    activeProfiler = profiler
+
+    return profiler
+
+def disableProfiling():
+    global activeProfiler
+
+    activeProfiler = None
+
+def isProfiling():
+    return activeProfiler is not None
+
+def stage(name):
+    profiler = activeProfiler
+
+    if profiler is None:
+        return NULL_STAGE
+
+    return ProfiledStage(profiler, name)
+
+def count(name, n = 1):
+    profiler = activeProfiler
+
+    if profiler is not None:
+        profiler.count(name, n)
+
+"""
+Decorator that times each call of the decorated function as a stage with the given name.
+"""
+def profiled(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = activeProfiler
+
+            if profiler is None:
+                return function(*args, **kwargs)
+
+            start = time.perf_counter()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.addStage(name, start, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
@@ -1,2 +1,9 @@
-from .fractionalPolarAxes import fractional_polar_axes
+from ..lazyImport import lazyAttributes
+
 from .polarSlidingWindow import *
+
+#Only needed for plotting, imported on first use as it pulls matplotlib
+__getattr__, __dir__ = lazyAttributes(__name__, globals(), {
+    "fractional_polar_axes": ".fractionalPolarAxes",
+    "NorthPolarAxes": ".fractionalPolarAxes",
+})
@@ -1,17 +1,12 @@
 #!/bin/env python3
 
 from __future__ import division, print_function
-from .fractionalPolarAxes import fractional_polar_axes
-
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 
 import numpy as np
 import tempfile
 
-from imageio import imread
-
 from auv_perception.annotation import Rectangle
+from .. import profiling
 
 def neighbors(p, imageSize):
     ret = []
@@ -37,6 +32,7 @@ Extracts a polar mask from a grayscale image by taking the assumption
 that black pixels correspond to mask positions, but only if they are connected,
 starting at (0, 0).
 """
+@profiling.profiled("extractPolarMask")
 def extractPolarMask(image):
     visited = np.zeros(image.shape, dtype = np.uint8)
 
@@ -68,6 +64,13 @@ Renders a polar mask from a given sonar ranges (in meters) and FOV (in degrees).
 The default fov is from an ARIS Explorer 3000.
 """
 def renderPolarMask(frameSize, ranges = (0.7, 1.7), fov = (-15, 15)):
+    #Plotting dependencies are only needed here
+    import matplotlib.pyplot as plt
+    import matplotlib.cm as cm
+
+    from imageio import imread
+    from .fractionalPolarAxes import fractional_polar_axes
+
     fig = plt.figure()
 
     frame = np.ones(frameSize)
@@ -109,6 +112,7 @@ Computes all the sliding window rectangles and returns them in a list (list of R
 The polarMask parameter is a image that defines the polar FOV. This image
 contains a 0 in pixels outside the FOV, and a value > 0 (usually 1) inside the FOV.
 """
+@profiling.profiled("polarSlidingWindow")
 def polarSlidingWindow(imageSize, windowSize, polarMask, stepSize = 2):
     actualPolarMask = None
 
@@ -159,3 +163,34 @@ def polarSlidingWindow(imageSize, windowSize, polarMask, stepSize = 2):
             windows.append(windowRect)
 
     return windows
+
+"""
+Vectorized version of polarSlidingWindow. Applies the same polar field of view tests to all
+sliding window positions at once, and returns the top left corners of the windows
+inside the FOV as a (N, 2) integer array, in the same order as polarSlidingWindow.
+"""
+@profiling.profiled("polarSlidingWindowPositions")
+def polarSlidingWindowPositions(imageSize, windowSize, polarMask, stepSize = 2):
+    actualPolarMask = None
+
+    #If polarMask shapes do not match, resize the polar mask
+    if polarMask.shape != imageSize:
+        actualPolarMask = imresize(polarMask, imageSize, interp = "bilinear")
+    else:
+        actualPolarMask = polarMask
+
+    xRange = imageSize[0] - windowSize[0]
+    yRange = imageSize[1] - windowSize[1]
+
+    x, y = np.meshgrid(np.arange(0, max(xRange, 0), stepSize), np.arange(0, max(yRange, 0), stepSize), indexing = "ij")
+    x = x.ravel()
+    y = y.ravel()
+
+    #Window start, its four corners, and the center, must be inside the FOV
+    inside = actualPolarMask[x, y] != 0
+    inside &= actualPolarMask[x + windowSize[0], y] != 0
+    inside &= actualPolarMask[x, y + windowSize[1]] != 0
+    inside &= actualPolarMask[x + windowSize[0], y + windowSize[1]] != 0
+    inside &= actualPolarMask[x + windowSize[0] // 2, y + windowSize[1] // 2] != 0
+
+    return np.stack([x[inside], y[inside]], axis = 1)
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+from __future__ import print_function
+
+import sys, os, argparse, subprocess, json
+
+packageRoot = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+#Modules that should only be imported when the functionality that needs them is used
+HEAVY_MODULES = ["keras", "tensorflow", "theano", "PyQt5", "matplotlib", "scipy", "h5py", "imageio", "PIL"]
+
+#Measured in a fresh interpreter, so previously imported modules do not hide the cost
+MEASURE_CODE = '''
+import sys, time, json
+sys.path.insert(0, {root!r})
+
+import numpy
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules.keys())}}))
+'''
+
+def measureImport(statement, repetitions):
+    times = []
+    modules = []
+
+    for i in range(repetitions):
+        code = MEASURE_CODE.format(root = packageRoot, statement = statement)
+        output = subprocess.check_output([sys.executable, "-c", code])
+        result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+        times.append(result["seconds"])
+        modules = result["modules"]
+
+    heavy = [name for name in HEAVY_MODULES if name in modules]
+    times.sort()
+
+    return times[len(times) // 2], heavy
+
+parser = argparse.ArgumentParser(description = "Measures the import time of auv_perception entry points. "
+                                               "NumPy is imported before timing, as every path needs it.")
+parser.add_argument("--repetitions", help = "Number of fresh interpreters per statement (median is reported)", type = int, default = 5)
+parser.add_argument("--budget", help = "Maximum import time in milliseconds for the I/O-only path", type = float, default = 100.0)
+args = parser.parse_args()
+
+statements = [
+    "import auv_perception",
+    "from auv_perception.fls import ARISFrameFile",
+    "from auv_perception.fls import generateProposals",
+    "from auv_perception.annotation import Rectangle",
+]
+
+ioOnlyTime = None
+
+for statement in statements:
+    seconds, heavy = measureImport(statement, args.repetitions)
+
+    print("{:55s} {:8.1f} ms   heavy modules loaded: {}".format(statement, seconds * 1000.0, ", ".join(heavy) if heavy else "none"))
+
+    if statement == "from auv_perception.fls import ARISFrameFile":
+        ioOnlyTime = seconds
+
+if ioOnlyTime * 1000.0 > args.budget:
+    print("I/O-only import path takes {:.1f} ms, over the {:.1f} ms budget".format(ioOnlyTime * 1000.0, args.budget))
+    sys.exit(1)
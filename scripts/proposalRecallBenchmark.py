@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+
+from __future__ import print_function
+
+import sys, os, argparse, json
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from auv_perception.fls import xmlDatasetFrames, hdf5DatasetFrames, runRecallBenchmark, recallReport
+
+parser = argparse.ArgumentParser(description = "Measures proposal recall on a labeled dataset, distributing frames over a process pool. "
+                                               "Interrupted runs continue from the results file.")
+parser.add_argument("--xml", help = "Labels in XML format (image paths are relative to the XML file)")
+parser.add_argument("--hdf5", help = "Labels and images in a HDF5 labels file")
+parser.add_argument("--evaluator", help = "Proposal evaluator class in auv_perception.fls", default = "CNNProposalScoreEvaluator")
+parser.add_argument("--evaluator-args", help = "Constructor arguments of the evaluator, as a JSON object", default = "{}")
+parser.add_argument("--proposal-args", help = "Arguments of generateProposals (or multiScaleDetections), as a JSON object", default = "{}")
+parser.add_argument("--iou-thresholds", help = "IoU thresholds for a ground truth box to be recalled", type = float, nargs = "+", default = [0.5])
+parser.add_argument("--matching", help = "Matching of proposals to ground truth", choices = ["greedy", "hungarian"], default = "greedy")
+parser.add_argument("--image-scale", help = "Factor applied to image intensities before scoring", type = float, default = 1.0)
+parser.add_argument("--processes", help = "Number of worker processes (all cores by default)", type = int, default = None)
+parser.add_argument("--chunk-size", help = "Frames per task sent to a worker", type = int, default = 32)
+parser.add_argument("--results", help = "JSON lines file with partial results, used to resume", default = None)
+parser.add_argument("--output", help = "Write the final report to this JSON file", default = None)
+args = parser.parse_args()
+
+if (args.xml is None) == (args.hdf5 is None):
+    parser.error("Exactly one of --xml and --hdf5 must be given")
+
+frames = xmlDatasetFrames(args.xml) if args.xml is not None else hdf5DatasetFrames(args.hdf5)
+
+config = {"evaluator": args.evaluator, "evaluatorArguments": json.loads(args.evaluator_args),
+          "proposalArguments": json.loads(args.proposal_args), "iouThresholds": args.iou_thresholds,
+          "matching": args.matching, "imageScale": args.image_scale}
+
+evaluator = runRecallBenchmark(frames, config, resultsFile = args.results, processes = args.processes, chunkSize = args.chunk_size)
+report = recallReport(evaluator)
+
+for t, recall in report["recall"].items():
+    print("Recall at IoU {}: {:.4f}".format(t, recall))
+
+print("Mean best IoU: {:.4f}".format(report["meanBestIoU"]))
+print("Proposals per frame: {:.1f}".format(report["proposalsPerFrame"]))
+
+if args.output is not None:
+    with open(args.output, "wt") as f:
+        json.dump(report, f, indent = 2)